@@ -1,9 +1,5 @@
 import logging
 import fire
-from streaming import StreamTool
-from submissions import SubmissionTool
-from comments import CommentTool
-from config import ConfigTool
 
 
 logging.basicConfig(
@@ -15,11 +11,37 @@ logging.basicConfig(
 
 
 class CommandLineInterface:
-    def __init__(self):
-        self.comments = CommentTool()
-        self.submissions = SubmissionTool()
-        self.config = ConfigTool()
-        self.stream = StreamTool()
+    # Each subcommand (and its dependencies) is only imported when it is actually used, to keep startup fast
+
+    @property
+    def comments(self):
+        from comments import CommentTool
+
+        return CommentTool()
+
+    @property
+    def submissions(self):
+        from submissions import SubmissionTool
+
+        return SubmissionTool()
+
+    @property
+    def config(self):
+        from config import ConfigTool
+
+        return ConfigTool()
+
+    @property
+    def stream(self):
+        from streaming import StreamTool
+
+        return StreamTool()
+
+    @property
+    def queue(self):
+        from workqueue import QueueTool
+
+        return QueueTool()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,6 @@
 from helpers import AbstractTool
 from typing import Union, Tuple, Optional
 import logging
-import downloading
-import extraction
-import processing
-import verification
 
 
 class CommentTool(AbstractTool):
@@ -21,6 +17,7 @@ class CommentTool(AbstractTool):
         retry: bool = False,
         max_attempts: int = 3,
     ) -> None:
+        import downloading
         self._initialize_dates(since, until)
         logging.info(f"Downloading available comment dumps from {self._get_date_range_str()}")
         for p in self.periods:
@@ -36,28 +33,179 @@ class CommentTool(AbstractTool):
             )
 
     def extract(
-        self, since: Union[str, int], until: Union[str, int, None], subreddit: str, force: bool = False
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        force: bool = False,
+        index: bool = True,
+        compress: bool = False,
+        workers: int = 1,
+        download: bool = False,
+        keep: bool = True,
+        sample: Optional[float] = None,
+        buffer_size: int = 2 ** 23,
     ) -> None:
+        import dumpindex
+        import extraction
         self._initialize_dates(since, until)
         subreddit = subreddit.lower().strip()
+        if sample is not None:
+            import sampling
+            logging.info(
+                f"Extracting a {sample:.1%} sample of comments for subreddit '{subreddit}' from {self._get_date_range_str()}"
+            )
+            for p in self.periods:
+                sampling.extract_sample(
+                    "RC",
+                    year=p[0],
+                    month=p[1],
+                    subreddit=subreddit,
+                    fraction=sample,
+                    force=force,
+                    index=index,
+                    compress=compress,
+                    workers=workers,
+                    buffer_size=buffer_size,
+                )
+            return
         logging.info(f"Extracting downloaded comments for subreddit '{subreddit}' from {self._get_date_range_str()}")
+        dumpindex.log_expected_sizes("RC", self.periods, subreddit)
         for p in self.periods:
-            extraction.extract_from_dump("RC", year=p[0], month=p[1], subreddit=subreddit, force=force)
+            extraction.extract_from_dump(
+                "RC",
+                year=p[0],
+                month=p[1],
+                subreddit=subreddit,
+                force=force,
+                index=index,
+                compress=compress,
+                workers=workers,
+                download=download,
+                keep=keep,
+                buffer_size=buffer_size,
+            )
+
+    def enqueue(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        force: bool = False,
+        index: bool = True,
+        compress: bool = False,
+        workers: int = 1,
+        download: bool = False,
+        keep: bool = True,
+        retry_failed: bool = False,
+        buffer_size: int = 2 ** 23,
+    ) -> None:
+        import workqueue
+        self._initialize_dates(since, until)
+        subreddit = subreddit.lower().strip()
+        logging.info(f"Queuing comment extraction tasks for subreddit '{subreddit}' from {self._get_date_range_str()}")
+        options = {
+            "force": force,
+            "index": index,
+            "compress": compress,
+            "workers": workers,
+            "download": download,
+            "keep": keep,
+            "buffer_size": buffer_size,
+        }
+        workqueue.enqueue("RC", self.periods, subreddit, options, retry_failed)
+
+    def dumpindex(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None] = None,
+        authors: bool = False,
+        force: bool = False,
+        workers: int = 1,
+    ) -> None:
+        import dumpindex
+        self._initialize_dates(since, until)
+        logging.info(f"Indexing the subreddits of downloaded comment dumps from {self._get_date_range_str()}")
+        for p in self.periods:
+            dumpindex.index_dump("RC", year=p[0], month=p[1], authors=authors, force=force, workers=workers)
+
+    def stats(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        sample: float = 0.01,
+        workers: int = 1,
+    ) -> None:
+        import sampling
+        self._initialize_dates(since, until)
+        subreddit = subreddit.lower().strip()
+        logging.info(
+            f"Estimating the number of '{subreddit}' comments from {self._get_date_range_str()} "
+            f"from a {sample:.1%} sample"
+        )
+        sampling.estimate_counts("RC", self.periods, subreddit, sample, workers)
 
-    def split(self, since: Union[str, int], until: Union[str, int, None], subreddit: str) -> None:
+    def split(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        use_mmap: bool = False,
+        index: bool = True,
+        compress: bool = False,
+        buffer_size: int = 2 ** 23,
+    ) -> None:
+        import processing
         self._initialize_dates(since, until)
         subreddit = subreddit.lower().strip()
         logging.info(
             f"Splitting monthly '{subreddit}' comment files from {self._get_date_range_str()} into daily files"
         )
         for p in self.periods:
-            processing.split_extracted("RC", year=p[0], month=p[1], subreddit=subreddit)
+            processing.split_extracted(
+                "RC",
+                year=p[0],
+                month=p[1],
+                subreddit=subreddit,
+                use_mmap=use_mmap,
+                index=index,
+                compress=compress,
+                buffer_size=buffer_size,
+            )
+
+    def threads(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        run_size: int = 200000,
+        index: bool = True,
+        compress: bool = False,
+    ) -> None:
+        import threads
+        self._initialize_dates(since, until)
+        subreddit = subreddit.lower().strip()
+        logging.info(f"Reconstructing '{subreddit}' comment threads from {self._get_date_range_str()}")
+        date_range_str = self._get_date_range_str().replace(" ", "_")
+        threads.reconstruct_threads(subreddit, since, until, date_range_str, run_size, index, compress)
+
+    def dictionary(
+        self, since: Union[str, int], until: Union[str, int, None] = None, n_samples: int = 100000
+    ) -> None:
+        import compression
+        self._initialize_dates(since, until)
+        logging.info(f"Training comment compression dictionary on dumps from {self._get_date_range_str()}")
+        compression.train_dictionary_from_dumps("RC", self.periods, n_samples)
 
     def checksize(self, size_ratio=0.8) -> None:
+        import verification
         verification.check_filesizes("RC", size_ratio)
 
     def checkhash(self) -> None:
+        import verification
         verification.check_filehashes("RC")
 
     def list(self, downloaded: bool = True, extracted: bool = False) -> None:
+        import verification
         verification.list_files("RC", downloaded, extracted)
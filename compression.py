@@ -0,0 +1,116 @@
+import functools
+import logging
+import os
+import pathlib
+from typing import BinaryIO, List, Optional
+import zstandard
+from config import get_data_dir
+from helpers import infer_extension
+from extraction import get_dump_path, iter_dump_lines
+
+
+DICT_SIZE = 2 ** 17  # 128KB
+COMPRESSION_LEVEL = 10
+FRAME_HEADER_SIZE_MAX = 18
+
+
+def get_prefix_for_path(fp: pathlib.Path) -> str:
+    """Extracted files start with RC_ / RS_, streamed files with rc_ / rs_"""
+    prefix = fp.name[:2].upper()
+    if prefix not in ("RC", "RS"):
+        raise ValueError(f"File {fp.name} has an invalid prefix")
+    return prefix
+
+
+def get_dictionary_path(prefix: str, dict_id: int) -> pathlib.Path:
+    """Dictionaries are stored by id, so retraining never replaces a dictionary that existing files refer to"""
+    return get_data_dir() / "dictionaries" / f"{prefix}_{dict_id}.zdict"
+
+
+def _get_current_dictionary_path(prefix: str) -> pathlib.Path:
+    return get_data_dir() / "dictionaries" / f"{prefix}.current"
+
+
+def train_dictionary(prefix: str, samples: List[bytes], dict_size: int = DICT_SIZE) -> pathlib.Path:
+    """Train a zstd dictionary from sample records, store it by its id and make it the one new files of the prefix
+    (i.e. comments or submissions) are compressed with"""
+    zdict = zstandard.train_dictionary(dict_size, samples)
+    fp = get_dictionary_path(prefix, zdict.dict_id())
+    fp.parent.mkdir(parents=True, exist_ok=True)
+    fp.write_bytes(zdict.as_bytes())
+    current_fp = _get_current_dictionary_path(prefix)
+    tmp_fp = current_fp.with_name(f"{current_fp.name}.tmp")
+    tmp_fp.write_text(str(zdict.dict_id()))
+    os.replace(tmp_fp, current_fp)
+    load_dictionary.cache_clear()
+    logging.info(f"Saved {prefix} dictionary (id {zdict.dict_id()}) trained on {len(samples):,} records to {fp}")
+    return fp
+
+
+def train_dictionary_from_dumps(
+    prefix: str, periods: List[tuple], n_samples: int = 100000, dict_size: int = DICT_SIZE
+) -> pathlib.Path:
+    """Sample the first records of each downloaded dump in periods and train the prefix's dictionary on them"""
+    n_per_period = max(1, n_samples // len(periods))
+    samples = []
+    for year, month in periods:
+        fp = get_dump_path(prefix, year, month)
+        if not fp.is_file():
+            logging.warning(f"File {fp.name} not found for sampling")
+            continue
+        n = 0
+        for ln in iter_dump_lines(fp, infer_extension(prefix, year, month)):
+            ln = ln.strip()
+            if len(ln) > 0:
+                samples.append(ln)
+                n += 1
+                if n >= n_per_period:
+                    break
+    if len(samples) == 0:
+        raise FileNotFoundError(f"No downloaded {prefix} dumps found to sample records from")
+    return train_dictionary(prefix, samples, dict_size)
+
+
+@functools.lru_cache(maxsize=None)
+def load_dictionary(prefix: str, dict_id: Optional[int] = None) -> zstandard.ZstdCompressionDict:
+    """Load the dictionary with the given id, or the current (most recently trained) one of the prefix"""
+    if dict_id is None:
+        current_fp = _get_current_dictionary_path(prefix)
+        if not current_fp.is_file():
+            raise FileNotFoundError(
+                f"No zstd dictionary found for {prefix} at {current_fp.parent} (train one with the dictionary command)"
+            )
+        dict_id = int(current_fp.read_text())
+    fp = get_dictionary_path(prefix, dict_id)
+    if not fp.is_file():
+        raise FileNotFoundError(f"The {prefix} zstd dictionary with id {dict_id} was not found at {fp}")
+    return zstandard.ZstdCompressionDict(fp.read_bytes())
+
+
+def compress_bytes(data: bytes, prefix: str, level: int = COMPRESSION_LEVEL) -> bytes:
+    return zstandard.ZstdCompressor(level=level, dict_data=load_dictionary(prefix)).compress(data)
+
+
+def open_compressed_writer(fp: pathlib.Path, prefix: str, level: int = COMPRESSION_LEVEL) -> BinaryIO:
+    cctx = zstandard.ZstdCompressor(level=level, dict_data=load_dictionary(prefix))
+    return cctx.stream_writer(open(fp, mode="wb"), closefd=True)
+
+
+def open_compressed_reader(fp: pathlib.Path) -> BinaryIO:
+    """Decompress with the dictionary that the file was written with, as referenced by its frame header"""
+    with open(fp, mode="rb") as h_in:
+        header = h_in.read(FRAME_HEADER_SIZE_MAX)
+    dict_id = zstandard.get_frame_parameters(header).dict_id if len(header) > 0 else 0
+    if dict_id == 0:
+        dctx = zstandard.ZstdDecompressor()
+    else:
+        dctx = zstandard.ZstdDecompressor(dict_data=load_dictionary(get_prefix_for_path(fp), dict_id))
+    return dctx.stream_reader(open(fp, mode="rb"), closefd=True)
+
+
+def open_extracted(fp: pathlib.Path) -> BinaryIO:
+    """Open an extracted / split file for binary reading, transparently decompressing .zst files.
+    Note that compressed readers only support seeking forward"""
+    if fp.suffix == ".zst":
+        return open_compressed_reader(fp)
+    return open(fp, mode="rb")
@@ -1,6 +1,24 @@
 import pathlib
 import json
 import logging
+import functools
+
+
+LOCAL_CONFIG_FP = pathlib.Path(__file__).parent.resolve() / "local_config.json"
+DEFAULT_DATA_DIR = pathlib.Path.home() / "thisdayinreddit"
+
+
+def load_local_config() -> dict:
+    try:
+        return json.loads(LOCAL_CONFIG_FP.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def get_data_dir() -> pathlib.Path:
+    """Resolve the data folder on first use (without writing anything), falling back to the default folder"""
+    return pathlib.Path(load_local_config().get("dataFolder", DEFAULT_DATA_DIR))
 
 
 class ConfigTool:
@@ -11,12 +29,15 @@ class ConfigTool:
                 dn.mkdir(parents=True, exist_ok=True)
             except IOError:
                 exit(f"It looks like {folder} is not a valid folder path")
-        d = {"dataFolder": folder}
+        d = load_local_config()
+        d["dataFolder"] = folder
         logging.info(f"Data folder set: '{dn}'")
         LOCAL_CONFIG_FP.write_text(json.dumps(d, indent=4))
+        get_data_dir.cache_clear()
 
     def auth(self, id: str, secret: str, password: str, agent: str, name: str) -> None:
-        d = json.loads(LOCAL_CONFIG_FP.read_text())
+        d = load_local_config()
+        d.setdefault("dataFolder", str(get_data_dir()))
         d["auth"] = {
             "clientId": id,
             "clientSecret": secret,
@@ -26,19 +47,3 @@ class ConfigTool:
         }
         logging.info(f"Reddit bot auth data saved")
         LOCAL_CONFIG_FP.write_text(json.dumps(d, indent=4))
-
-
-LOCAL_CONFIG_FP = pathlib.Path(__file__).parent.resolve() / "local_config.json"
-if LOCAL_CONFIG_FP.is_file():
-    d = json.loads(LOCAL_CONFIG_FP.read_text())
-    DATA_DIR = pathlib.Path(d["dataFolder"])
-else:
-    default_dir = pathlib.Path.home() / "thisdayinreddit"
-    d = {"dataFolder": str(default_dir)}
-    logging.info(f"Data folder set: '{default_dir}'")
-    LOCAL_CONFIG_FP.write_text(json.dumps(d, indent=4))
-    DATA_DIR = default_dir
-
-for sub_dn in ["compressed", "extracted"]:
-    dn = DATA_DIR / sub_dn
-    dn.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,274 @@
+import bz2
+import collections
+import logging
+import lzma
+import mmap
+import multiprocessing as mp
+import pathlib
+import struct
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_EOS_MAGIC = 0x177245385090
+XZ_HEADER_MAGIC = b"\xfd7zXZ\x00"
+READ_SIZE = 2 ** 23  # 8MB
+
+
+# bz2 ---------------------------------------------------------------------------------------------------------------
+
+
+def _get_bz2_patterns(magic: int) -> List[Tuple[int, int, bytes]]:
+    """The magic numbers are bit-aligned, so get the fully-determined bytes of the 48 bit magic for each of the
+    8 possible bit shifts, as (shift, offset of the pattern from the byte containing the first magic bit, pattern)"""
+    patterns = []
+    for shift in range(8):
+        shifted = (magic << (8 - shift)).to_bytes(7, "big")
+        if shift == 0:
+            patterns.append((shift, 0, shifted[:6]))
+        else:
+            patterns.append((shift, 1, shifted[1:6]))
+    return patterns
+
+
+def _read_bits(buf, bit_pos: int, n_bits: int) -> int:
+    start = bit_pos // 8
+    end = (bit_pos + n_bits + 7) // 8
+    value = int.from_bytes(buf[start:end], "big")
+    value >>= end * 8 - bit_pos - n_bits
+    return value & ((1 << n_bits) - 1)
+
+
+def _find_bz2_magic(mm: mmap.mmap, magic: int) -> List[int]:
+    """Bit positions of all occurrences of a 48 bit magic number in the file"""
+    positions = []
+    size = len(mm)
+    for shift, offset, pattern in _get_bz2_patterns(magic):
+        pos = mm.find(pattern)
+        while pos != -1:
+            bit_pos = (pos - offset) * 8 + shift
+            if bit_pos >= 0 and bit_pos + 48 <= size * 8 and _read_bits(mm, bit_pos, 48) == magic:
+                positions.append(bit_pos)
+            pos = mm.find(pattern, pos + 1)
+    return positions
+
+
+def _locate_bz2_blocks(fp: pathlib.Path) -> List[Tuple[int, int]]:
+    """(start bit, end bit) of every compressed block in a (possibly multi-stream) bz2 file, where each block
+    ends at the next block or end-of-stream marker"""
+    with open(fp, mode="rb") as h_in, mmap.mmap(h_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        blocks = _find_bz2_magic(mm, BZ2_BLOCK_MAGIC)
+        ends = _find_bz2_magic(mm, BZ2_EOS_MAGIC)
+    markers = sorted([(p, True) for p in blocks] + [(p, False) for p in ends])
+    segments = []
+    for (start, is_block), (end, _) in zip(markers, markers[1:]):
+        if is_block is True:
+            segments.append((start, end))
+    return segments
+
+
+def _decompress_bz2_segment(fp: str, start_bit: int, end_bit: int) -> Optional[bytes]:
+    """Decompress a single bz2 block by wrapping its bits into a stand-alone stream (the combined CRC of a
+    stream with a single block is that block's CRC, which directly follows the block magic)"""
+    with open(fp, mode="rb") as h_in:
+        h_in.seek(start_bit // 8)
+        buf = h_in.read((end_bit + 7) // 8 - start_bit // 8)
+    shift = start_bit % 8
+    n_bits = end_bit - start_bit
+    block = _read_bits(buf, shift, n_bits)
+    block_crc = _read_bits(buf, shift + 48, 32)
+    stream = int.from_bytes(b"BZh9", "big")  # the largest block size works for blocks of any level
+    stream = (stream << n_bits) | block
+    stream = (stream << 48) | BZ2_EOS_MAGIC
+    stream = (stream << 32) | block_crc
+    total_bits = 32 + n_bits + 48 + 32
+    padding = -total_bits % 8
+    stream <<= padding
+    try:
+        return bz2.decompress(stream.to_bytes((total_bits + padding) // 8, "big"))
+    except (OSError, ValueError, EOFError):
+        return None
+
+
+# xz ----------------------------------------------------------------------------------------------------------------
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    value, i = 0, 0
+    while True:
+        byte = buf[pos]
+        value |= (byte & 0x7F) << (7 * i)
+        pos += 1
+        i += 1
+        if byte & 0x80 == 0:
+            return value, pos
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _locate_xz_blocks(fp: pathlib.Path) -> List[Tuple[bytes, int, int, int]]:
+    """(stream header, offset, unpadded size, uncompressed size) of every block of a (possibly multi-stream) xz
+    file, read from the stream indexes at the end of each stream"""
+    blocks = []
+    with open(fp, mode="rb") as h_in, mmap.mmap(h_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm)
+        while end > 0:
+            while end >= 4 and mm[end - 4 : end] == b"\x00\x00\x00\x00":  # stream padding
+                end -= 4
+            footer = mm[end - 12 : end]
+            if footer[10:12] != b"YZ":
+                raise ValueError(f"{fp.name} has an invalid xz stream footer")
+            index_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+            index_start = end - 12 - index_size
+            index = mm[index_start : end - 12]
+            n_records, pos = _read_varint(index, 1)
+            records = []
+            for _ in range(n_records):
+                unpadded, pos = _read_varint(index, pos)
+                uncompressed, pos = _read_varint(index, pos)
+                records.append((unpadded, uncompressed))
+            stream_start = index_start - sum((u + 3) // 4 * 4 for u, _ in records) - 12
+            header = mm[stream_start : stream_start + 12]
+            if header[:6] != XZ_HEADER_MAGIC:
+                raise ValueError(f"{fp.name} has an invalid xz stream header")
+            offset = stream_start + 12
+            stream_blocks = []
+            for unpadded, uncompressed in records:
+                stream_blocks.append((header, offset, unpadded, uncompressed))
+                offset += (unpadded + 3) // 4 * 4
+            blocks = stream_blocks + blocks
+            end = stream_start
+    return blocks
+
+
+def _decompress_xz_block(fp: str, header: bytes, offset: int, unpadded: int, uncompressed: int) -> bytes:
+    """Decompress a single xz block by wrapping it into a stand-alone stream with a one-record index"""
+    with open(fp, mode="rb") as h_in:
+        h_in.seek(offset)
+        block = h_in.read((unpadded + 3) // 4 * 4)
+    index = b"\x00" + _encode_varint(1) + _encode_varint(unpadded) + _encode_varint(uncompressed)
+    index += b"\x00" * (-len(index) % 4)
+    index += struct.pack("<I", zlib.crc32(index))
+    backward_size = struct.pack("<I", len(index) // 4 - 1)
+    flags = header[6:8]
+    footer = struct.pack("<I", zlib.crc32(backward_size + flags)) + backward_size + flags + b"YZ"
+    return lzma.decompress(header + block + index + footer, format=lzma.FORMAT_XZ)
+
+
+# zst ---------------------------------------------------------------------------------------------------------------
+
+
+ZST_FRAME_MAGIC = 0xFD2FB528
+ZST_MAX_WINDOW_SIZE = 2147483648
+
+
+def _locate_zst_frames(fp: pathlib.Path) -> List[Tuple[int, int]]:
+    """(offset, size) of every zstd frame of a file, found by walking the frame & block headers without
+    decompressing anything (skippable frames are left out)"""
+    frames = []
+    with open(fp, mode="rb") as h_in, mmap.mmap(h_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        pos = 0
+        while pos + 4 <= size:
+            magic = struct.unpack_from("<I", mm, pos)[0]
+            if magic & 0xFFFFFFF0 == 0x184D2A50:  # skippable frame
+                pos += 8 + struct.unpack_from("<I", mm, pos + 4)[0]
+                continue
+            if magic != ZST_FRAME_MAGIC:
+                raise ValueError(f"{fp.name} has an invalid zstd frame at byte {pos}")
+            start = pos
+            descriptor = mm[pos + 4]
+            fcs_flag, single_segment = descriptor >> 6, (descriptor >> 5) & 1
+            has_checksum, dict_id_flag = (descriptor >> 2) & 1, descriptor & 3
+            pos += 5
+            pos += 0 if single_segment else 1  # window descriptor
+            pos += (0, 1, 2, 4)[dict_id_flag]
+            pos += (single_segment, 2, 4, 8)[fcs_flag]
+            while True:
+                header = int.from_bytes(mm[pos : pos + 3], "little")
+                is_last, block_type, block_size = header & 1, (header >> 1) & 3, header >> 3
+                pos += 3 + (1 if block_type == 1 else block_size)  # RLE blocks store a single byte
+                if is_last:
+                    break
+            pos += 4 if has_checksum else 0
+            frames.append((start, pos - start))
+    return frames
+
+
+def _decompress_zst_frame(fp: str, offset: int, size: int) -> bytes:
+    with open(fp, mode="rb") as h_in:
+        h_in.seek(offset)
+        frame = h_in.read(size)
+    import zstandard
+
+    return zstandard.ZstdDecompressor(max_window_size=ZST_MAX_WINDOW_SIZE).decompressobj().decompress(frame)
+
+
+# shared ------------------------------------------------------------------------------------------------------------
+
+
+def _iter_sequential_chunks(fp: pathlib.Path, ext: str) -> Iterator[bytes]:
+    opener = bz2.BZ2File if ext == "bz2" else lzma.LZMAFile
+    with opener(fp) as h_in:
+        while True:
+            chunk = h_in.read(READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _iter_parallel_results(func, fp: pathlib.Path, tasks: list, workers: int) -> Iterator[Tuple[tuple, Optional[bytes]]]:
+    """Run func for all tasks in a pool, yielding results in task order while keeping only a bounded number of
+    tasks in flight, so that decompressed data can't pile up in memory if the consumer is slower"""
+    tasks = iter(tasks)
+    pending = collections.deque()
+    with mp.Pool(workers) as pool:
+        for task in tasks:
+            pending.append((task, pool.apply_async(func, (str(fp), *task))))
+            if len(pending) >= workers * 2:
+                break
+        while len(pending) > 0:
+            task, result = pending.popleft()
+            next_task = next(tasks, None)
+            if next_task is not None:
+                pending.append((next_task, pool.apply_async(func, (str(fp), *next_task))))
+            yield task, result.get()
+
+
+def iter_decompressed_chunks(fp: pathlib.Path, ext: str, workers: int = 1) -> Iterator[bytes]:
+    """Yield the decompressed content of a bz2 or xz dump as chunks (in order), decompressing independent
+    blocks on multiple cores where possible and falling back to sequential decompression otherwise"""
+    if ext == "bz2" and workers > 1:
+        segments = _locate_bz2_blocks(fp)
+        if len(segments) > 1:
+            logging.info(f"Decompressing {len(segments):,} bz2 blocks of {fp.name} with {workers} processes")
+            failed_start = None
+            for (start, end), chunk in _iter_parallel_results(_decompress_bz2_segment, fp, segments, workers):
+                if failed_start is not None:  # a false block magic within compressed data splits a real block
+                    start = failed_start
+                    chunk = _decompress_bz2_segment(str(fp), start, end)
+                if chunk is None:
+                    failed_start = start
+                else:
+                    failed_start = None
+                    yield chunk
+            if failed_start is not None:
+                raise OSError(f"Unable to decompress the bz2 block of {fp.name} starting at bit {failed_start}")
+            return
+    elif ext == "xz" and workers > 1:
+        blocks = _locate_xz_blocks(fp)
+        if len(blocks) > 1:
+            logging.info(f"Decompressing {len(blocks):,} xz blocks of {fp.name} with {workers} processes")
+            for _, chunk in _iter_parallel_results(_decompress_xz_block, fp, blocks, workers):
+                yield chunk
+            return
+        logging.info(f"{fp.name} consists of a single xz block, decompressing it sequentially")
+    yield from _iter_sequential_chunks(fp, ext)
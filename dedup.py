@@ -0,0 +1,98 @@
+import array
+import bisect
+import logging
+import os
+import pathlib
+import struct
+import time
+from typing import Iterable, Optional
+
+
+class SeenIdStore:
+    """Persistent set of already-written reddit ids, stored compactly as base36-decoded integers.
+
+    The ids are kept in a sorted array (8 bytes each) alongside the time each item was written (8 bytes each),
+    so that entries written before the retention period can be evicted on save. The most recently written
+    MIN_KEEP ids are never evicted, as reddit replays up to 100 recent items on restart however old they are."""
+
+    HEADER = struct.Struct("<4sQ")
+    MAGIC = b"SEEN"
+    MIN_KEEP = 100
+
+    def __init__(self, fp: pathlib.Path, retention_days: float = 7) -> None:
+        self.fp = fp
+        self.retention = retention_days * 86400
+        self.ids = array.array("Q")
+        self.timestamps = array.array("q")
+        self._load()
+
+    @staticmethod
+    def _decode_id(item_id: str) -> int:
+        if "_" in item_id:  # fullnames such as t1_abc123
+            item_id = item_id.split("_", 1)[1]
+        return int(item_id, 36)
+
+    def _load(self) -> None:
+        try:
+            raw = self.fp.read_bytes()
+        except FileNotFoundError:
+            return
+        try:
+            magic, n = self.HEADER.unpack_from(raw)
+        except struct.error:
+            magic, n = None, 0
+        if magic != self.MAGIC or len(raw) != self.HEADER.size + n * 16:
+            logging.warning(f"Ignoring corrupt seen-id file {self.fp}")
+            return
+        start = self.HEADER.size
+        self.ids.frombytes(raw[start : start + n * 8])
+        self.timestamps.frombytes(raw[start + n * 8 :])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        key = self._decode_id(item_id)
+        i = bisect.bisect_left(self.ids, key)
+        return i < len(self.ids) and self.ids[i] == key
+
+    def add(self, item_id: str, written_utc: Optional[float] = None) -> None:
+        if written_utc is None:
+            written_utc = time.time()
+        key = self._decode_id(item_id)
+        i = bisect.bisect_left(self.ids, key)
+        if i < len(self.ids) and self.ids[i] == key:
+            self.timestamps[i] = int(written_utc)
+            return
+        self.ids.insert(i, key)
+        self.timestamps.insert(i, int(written_utc))
+
+    def update(self, item_ids: Iterable[str]) -> None:
+        written_utc = time.time()
+        for item_id in item_ids:
+            self.add(item_id, written_utc)
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Drop all ids written before the retention period (except for the MIN_KEEP most recently written ones),
+        returns the number of evicted ids"""
+        if now is None:
+            now = time.time()
+        if len(self.ids) <= self.MIN_KEEP:
+            return 0
+        cutoff = min(int(now - self.retention), sorted(self.timestamps)[-self.MIN_KEEP])
+        keep = [i for i, ts in enumerate(self.timestamps) if ts >= cutoff]
+        n_evicted = len(self.ids) - len(keep)
+        if n_evicted > 0:
+            self.ids = array.array("Q", (self.ids[i] for i in keep))
+            self.timestamps = array.array("q", (self.timestamps[i] for i in keep))
+        return n_evicted
+
+    def save(self) -> None:
+        self.evict()
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        tmp_fp = self.fp.with_name(f"{self.fp.name}.tmp")
+        with open(tmp_fp, "wb") as h_out:
+            h_out.write(self.HEADER.pack(self.MAGIC, len(self.ids)))
+            h_out.write(self.ids.tobytes())
+            h_out.write(self.timestamps.tobytes())
+        os.replace(tmp_fp, self.fp)  # atomic, so a crash never leaves a half-written file behind
@@ -6,9 +6,25 @@ from typing import Optional
 import urllib3
 import multiprocessing as mp
 import time
+import os
+import contextlib
 from helpers import infer_extension, get_file_size_info_str, convert_size_to_str
 from verification import check_filehash, check_filesize
-from config import DATA_DIR
+from config import get_data_dir
+
+
+DUMP_BASE_URL = "http://repo.pushshift.io/reddit"
+
+
+def get_dump_url(prefix: str, year: int, month: int) -> str:
+    ext = infer_extension(prefix, year, month)
+    date_str = f"{year}-{str(month).zfill(2)}"
+    if prefix == "RC":
+        return f"{DUMP_BASE_URL}/comments/RC_{date_str}.{ext}"  # varying extenions
+    elif prefix == "RS":
+        return f"{DUMP_BASE_URL}/submissions/RS_{date_str}.zst"
+    else:
+        raise ValueError("Invalid value for 'prefix'")
 
 
 def download_checksum_file(kind: str = "comments") -> pathlib.Path:
@@ -18,7 +34,8 @@ def download_checksum_file(kind: str = "comments") -> pathlib.Path:
         url = "https://files.pushshift.io/reddit/submissions/sha256sums.txt"
     else:
         raise ValueError("Invalid value for 'kind' in download_checksum_file")
-    fp = DATA_DIR / f"sha256sums_{kind}.txt"
+    fp = get_data_dir() / f"sha256sums_{kind}.txt"
+    fp.parent.mkdir(parents=True, exist_ok=True)
     _download_file(url, fp, monitor=False)  # TODO: Raise appropriate exception if dowload fails
     return fp
 
@@ -74,6 +91,68 @@ def _download_file(
         return False
 
 
+class _TeeReader:
+    """Read-only file-like wrapper around a HTTP response that copies everything read to h_copy (if given),
+    so that a dump can be decompressed while it is being downloaded"""
+
+    def __init__(self, resp, h_copy=None, target_size: Optional[float] = None) -> None:
+        self.resp = resp
+        self.h_copy = h_copy
+        self.target_size = target_size
+        self.n_bytes = 0
+        self.last_logged = time.monotonic()
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.resp.read(None if size is None or size < 0 else size)
+        if self.h_copy is not None:
+            self.h_copy.write(data)
+        self.n_bytes += len(data)
+        if time.monotonic() - self.last_logged > 60:
+            self.last_logged = time.monotonic()
+            if self.target_size is not None:
+                logging.info(
+                    f"{convert_size_to_str(self.n_bytes)} / {convert_size_to_str(self.target_size)} downloaded so far"
+                )
+            else:
+                logging.info(f"{convert_size_to_str(self.n_bytes)} downloaded so far")
+        return data
+
+
+@contextlib.contextmanager
+def open_dump_stream(url: str, fp: Optional[pathlib.Path] = None):
+    """Open a dump url for streaming reads (None if it isn't available). If fp is given, the compressed data is
+    also saved there, under a temporary name until the whole file was downloaded"""
+    retries = urllib3.util.retry.Retry(connect=5, read=3, redirect=3)
+    http = urllib3.PoolManager(retries=retries)
+    resp = http.request("GET", url, preload_content=False)
+    if resp.status != 200:
+        logging.error(f"Unable to download {url} (HTTP status {resp.status})")
+        resp.release_conn()
+        yield None
+        return
+    target_size = resp.headers.get("Content-Length")
+    if target_size is not None:
+        target_size = int(target_size)
+        logging.info(f"Approximate file size: {convert_size_to_str(target_size)}")
+    part_fp = None if fp is None else fp.with_name(f"{fp.name}.part")
+    h_copy = None if part_fp is None else open(part_fp, mode="wb")
+    try:
+        yield _TeeReader(resp, h_copy, target_size)
+        if h_copy is not None:  # the decompressor may stop before the end of the file
+            shutil.copyfileobj(resp, h_copy)
+            h_copy.close()
+            os.replace(part_fp, fp)
+            logging.info(f"Saved {fp.name} ({get_file_size_info_str(fp)})")
+    finally:
+        resp.release_conn()
+        if h_copy is not None and not h_copy.closed:
+            h_copy.close()
+            part_fp.unlink()
+
+
 def _get_paths_for_urls(urls: list, data_dir: pathlib.Path) -> "list[pathlib.Path]":
     files = [data_dir / u.split("/")[-1] for u in urls]
     return files
@@ -90,17 +169,10 @@ def download_dump(
     max_attempts: int = 3,
     n_attempts: int = 0,
 ) -> None:
-    data_dir = DATA_DIR / "compressed"
-    ext = infer_extension(prefix, year, month)
+    data_dir = get_data_dir() / "compressed"
+    data_dir.mkdir(parents=True, exist_ok=True)
     date_str = f"{year}-{str(month).zfill(2)}"
-    urls = []
-    if prefix == "RC":
-        urls.append(f"http://repo.pushshift.io/reddit/comments/RC_{date_str}.{ext}")  # varying extenions
-
-    elif prefix == "RS":
-        urls.append(f"http://repo.pushshift.io/reddit/submissions/RS_{date_str}.zst")
-    else:
-        raise ValueError("Invalid value for 'prefix'")
+    urls = [get_dump_url(prefix, year, month)]
 
     paths = _get_paths_for_urls(urls, data_dir)
     dl_urls = []
@@ -0,0 +1,196 @@
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import math
+import os
+import pathlib
+import re
+import struct
+from typing import Iterable, List, Optional
+from extraction import get_dump_path, iter_dump_lines
+from helpers import convert_size_to_str, infer_extension
+
+
+SUBREDDIT_PATTERN = re.compile(rb'"subreddit":\s*"([^"\\]*)"')
+AUTHOR_PATTERN = re.compile(rb'"author":\s*"([^"\\]*)"')
+FALSE_POSITIVE_RATE = 0.001
+
+
+class BloomFilter:
+    """Compact set membership test without false negatives (and with about false_positive_rate false
+    positives), using double hashing of a single blake2b digest to derive the k bit positions"""
+
+    HEADER = struct.Struct("<4sHIQQ")
+    MAGIC = b"PSBF"
+    VERSION = 1
+
+    def __init__(self, n_bits: int, n_hashes: int, dump_size: int = 0) -> None:
+        self.n_bits = max(8, n_bits)
+        self.n_hashes = max(1, n_hashes)
+        self.dump_size = dump_size
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(
+        cls, n: int, false_positive_rate: float = FALSE_POSITIVE_RATE, dump_size: int = 0
+    ) -> "BloomFilter":
+        n = max(1, n)
+        n_bits = math.ceil(-n * math.log(false_positive_rate) / math.log(2) ** 2)
+        return cls(n_bits, round(n_bits / n * math.log(2)), dump_size)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.lower().encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def save(self, fp: pathlib.Path) -> None:
+        tmp_fp = fp.with_name(f"{fp.name}.tmp")
+        with open(tmp_fp, "wb") as h_out:
+            h_out.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.n_hashes, self.n_bits, self.dump_size))
+            h_out.write(self.bits)
+        os.replace(tmp_fp, fp)
+
+    @classmethod
+    def load(cls, fp: pathlib.Path) -> "BloomFilter":
+        with open(fp, "rb") as h_in:
+            magic, version, n_hashes, n_bits, dump_size = cls.HEADER.unpack(h_in.read(cls.HEADER.size))
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ValueError(f"{fp} is not a valid bloom filter")
+            bloom = cls(n_bits, n_hashes, dump_size)
+            bloom.bits = bytearray(h_in.read())
+        return bloom
+
+
+def get_histogram_path(dump_fp: pathlib.Path) -> pathlib.Path:
+    return dump_fp.with_name(f"{dump_fp.name}.subreddits.json")
+
+
+def get_bloom_path(dump_fp: pathlib.Path, field: str = "subreddit") -> pathlib.Path:
+    return dump_fp.with_name(f"{dump_fp.name}.{field}s.bloom")
+
+
+def _get_field(ln: bytes, pattern: re.Pattern, field: str) -> Optional[str]:
+    """Find a field's value with a regex, parsing the whole line only if the regex doesn't find exactly one
+    value (e.g. for crossposts, which contain the fields of the original submission as well)"""
+    matches = pattern.findall(ln)
+    if len(matches) == 1:
+        return matches[0].decode("utf-8", errors="ignore")
+    try:
+        value = json.loads(ln).get(field)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return value if isinstance(value, str) else None
+
+
+def index_dump(
+    prefix: str, year: int, month: int, authors: bool = False, force: bool = False, workers: int = 1
+) -> None:
+    """Store a subreddit -> [lines, bytes] histogram and a bloom filter of subreddit names (and optionally
+    of authors) next to a downloaded dump, so later extractions can skip dumps without any matches"""
+    fp = get_dump_path(prefix, year, month)
+    if not fp.is_file():
+        logging.warning(f"File {fp.name} not found for indexing")
+        return
+    hist_fp = get_histogram_path(fp)
+    if force is False and hist_fp.is_file() and (authors is False or get_bloom_path(fp, "author").is_file()):
+        logging.info(f"Skipping indexing of {fp.name} because it is indexed already (--force=True to override this)")
+        return
+    logging.info(f"Indexing subreddits{' and authors' if authors is True else ''} of {fp}")
+    start = datetime.datetime.utcnow()
+    lines = collections.Counter()
+    sizes = collections.Counter()
+    author_names = set()
+    n = 0
+    for ln in iter_dump_lines(fp, infer_extension(prefix, year, month), workers):
+        n += 1
+        subreddit = _get_field(ln, SUBREDDIT_PATTERN, "subreddit")
+        if subreddit is not None:
+            subreddit = subreddit.lower()
+            lines[subreddit] += 1
+            sizes[subreddit] += len(ln) + 2  # plus the ,\n separator within the extracted JSON array
+        if authors is True:
+            author = _get_field(ln, AUTHOR_PATTERN, "author")
+            if author is not None:
+                author_names.add(author.lower())
+    dump_size = fp.stat().st_size
+    bloom = BloomFilter.for_capacity(len(lines), dump_size=dump_size)
+    for subreddit in lines:
+        bloom.add(subreddit)
+    bloom.save(get_bloom_path(fp))
+    if authors is True:
+        author_bloom = BloomFilter.for_capacity(len(author_names), dump_size=dump_size)
+        for author in author_names:
+            author_bloom.add(author)
+        author_bloom.save(get_bloom_path(fp, "author"))
+    histogram = {s: [lines[s], sizes[s]] for s in sorted(lines, key=lines.get, reverse=True)}
+    tmp_fp = hist_fp.with_name(f"{hist_fp.name}.tmp")
+    tmp_fp.write_text(json.dumps({"dump_size": dump_size, "lines": n, "subreddits": histogram}))
+    os.replace(tmp_fp, hist_fp)
+    duration = str(datetime.datetime.utcnow() - start).split(".")[0].zfill(8)
+    logging.info(f"Indexed {n:,} lines of {len(lines):,} subreddits of {fp.name} after {duration}")
+
+
+def _load_bloom(dump_fp: pathlib.Path, field: str) -> Optional[BloomFilter]:
+    fp = get_bloom_path(dump_fp, field)
+    if not fp.is_file():
+        return None
+    bloom = BloomFilter.load(fp)
+    if bloom.dump_size != dump_fp.stat().st_size:
+        logging.warning(f"Ignoring outdated {fp.name} (the dump has changed since it was indexed)")
+        return None
+    return bloom
+
+
+def might_contain(dump_fp: pathlib.Path, field: str, value: str) -> Optional[bool]:
+    """Whether a dump may contain lines with the given subreddit / author, None if it wasn't indexed"""
+    if not dump_fp.is_file():
+        return None
+    bloom = _load_bloom(dump_fp, field)
+    if bloom is None:
+        return None
+    return value.lower() in bloom
+
+
+def get_expected_size(dump_fp: pathlib.Path, subreddit: str) -> Optional[List[int]]:
+    """[lines, bytes] that an extraction of the subreddit from the dump will yield, None if it wasn't indexed"""
+    if not dump_fp.is_file():
+        return None
+    if might_contain(dump_fp, "subreddit", subreddit) is False:
+        return [0, 0]
+    hist_fp = get_histogram_path(dump_fp)
+    if not hist_fp.is_file():
+        return None
+    d = json.loads(hist_fp.read_text())
+    if d["dump_size"] != dump_fp.stat().st_size:
+        logging.warning(f"Ignoring outdated {hist_fp.name} (the dump has changed since it was indexed)")
+        return None
+    return d["subreddits"].get(subreddit.lower(), [0, 0])
+
+
+def log_expected_sizes(prefix: str, periods: List[tuple], subreddit: str) -> None:
+    """Log the expected number of lines and bytes of an extraction up front, as far as the dumps are indexed"""
+    n_lines, n_bytes, n_empty, n_unknown = 0, 0, 0, 0
+    for year, month in periods:
+        expected = get_expected_size(get_dump_path(prefix, year, month), subreddit)
+        if expected is None:
+            n_unknown += 1
+        elif expected[0] == 0:
+            n_empty += 1
+        else:
+            n_lines += expected[0]
+            n_bytes += expected[1]
+    if n_unknown < len(periods):
+        logging.info(
+            f"Expecting {n_lines:,} lines ({convert_size_to_str(n_bytes)}) for '{subreddit}' from "
+            f"{len(periods) - n_unknown - n_empty} indexed dump(s), skipping {n_empty} dump(s) without any matches "
+            f"({n_unknown} dump(s) not indexed)"
+        )
@@ -1,25 +1,209 @@
 import datetime
 import logging
-from typing import Optional
+import contextlib
+from typing import Optional, Iterator, Union, BinaryIO, Tuple
 import bz2
 import lzma
 import json
-import zstandard
-from config import DATA_DIR
-from helpers import (
-    infer_extension,
-    is_relevant_ln,
-    count_and_log,
-    create_ln_str_with_json_boilerplate,
-)
+import os
+import pathlib
+import socket
+from config import get_data_dir
+from decompression import iter_decompressed_chunks
+from helpers import infer_extension, load_relevant_ln
+from indexing import get_index_path
+from writing import BUFFER_SIZE, JsonArrayWriter
 
 
-def extract_from_dump(prefix: str, year: int, month: int, subreddit: str, force: bool = False) -> None:
+def get_dump_path(prefix: str, year: int, month: int) -> pathlib.Path:
+    ext = infer_extension(prefix, year, month)
+    return get_data_dir() / "compressed" / f"{prefix}_{year}-{str(month).zfill(2)}.{ext}"
+
+
+def get_extracted_path(prefix: str, year: int, month: int, subreddit: str, compress: bool = False) -> pathlib.Path:
+    out_dn = get_data_dir() / f"extracted/monthly/{subreddit}"
+    ext = "json.zst" if compress is True else "json"
+    return out_dn / f"{prefix}_{subreddit}_{year}-{str(month).zfill(2)}.{ext}"
+
+
+READ_SIZE = 2 ** 24  # 16MB
+
+
+class _ChunkReader:
+    """Minimal readinto-only file-like wrapper around an iterator of decompressed chunks"""
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = chunks
+        self.chunk = memoryview(b"")
+
+    def readinto(self, b) -> int:
+        while len(self.chunk) == 0:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.chunk = memoryview(chunk)
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+
+@contextlib.contextmanager
+def open_dump(fp: Union[pathlib.Path, BinaryIO], ext: str, workers: int = 1):
+    """Open a downloaded dump file (or a readable binary file object) as a stream of decompressed bytes"""
+    if ext in ("bz2", "xz") and workers > 1 and isinstance(fp, pathlib.Path):
+        yield _ChunkReader(iter_decompressed_chunks(fp, ext, workers))
+    elif ext == "bz2":
+        with bz2.BZ2File(fp) as h_in:
+            yield h_in
+    elif ext == "xz":
+        with lzma.LZMAFile(fp) as h_in:
+            yield h_in
+    elif ext == "zst":
+        import zstandard  # only needed for zst dumps, so avoid the import cost for everything else
+
+        with open(fp, "rb") if isinstance(fp, pathlib.Path) else contextlib.nullcontext(fp) as h_in:
+            decomp = zstandard.ZstdDecompressor(max_window_size=2147483648)
+            with decomp.stream_reader(h_in, read_across_frames=True) as reader:
+                yield reader
+    elif ext == "json":  # already decompressed data
+        with open(fp, "rb") if isinstance(fp, pathlib.Path) else contextlib.nullcontext(fp) as h_in:
+            yield h_in
+    else:
+        raise ValueError(f"Unsupported file extension '{ext}'")
+
+
+def _iter_buffers(reader, read_size: int = READ_SIZE) -> Iterator[Tuple[bytearray, int]]:
+    """Fill one reused buffer from the reader and yield (buffer, end) where buffer[:end] holds only complete
+    lines (including their trailing newline), carrying any incomplete last line over to the next fill"""
+    buf = bytearray(read_size)
+    filled = 0
+    while True:
+        if filled == len(buf):  # a single line longer than the buffer
+            buf.extend(bytes(len(buf)))
+        with memoryview(buf) as mv:
+            n = reader.readinto(mv[filled:])
+        if not n:
+            break
+        filled += n
+        end = buf.rfind(b"\n", 0, filled) + 1
+        if end > 0:
+            yield buf, end
+            buf[: filled - end] = buf[end:filled]  # move the incomplete last line to the front
+            filled -= end
+    if filled > 0:  # last line without trailing newline
+        buf[filled : filled + 1] = b"\n"
+        yield buf, filled + 1
+
+
+def iter_dump_lines(fp: Union[pathlib.Path, BinaryIO], ext: str, workers: int = 1) -> Iterator[bytes]:
+    """Lazily yield the (non-empty) decompressed lines of a downloaded dump file as bytes"""
+    with open_dump(fp, ext, workers) as reader:
+        for buf, end in _iter_buffers(reader):
+            start = 0
+            while start < end:
+                ln_end = buf.find(b"\n", start, end)
+                if ln_end > start:
+                    yield bytes(buf[start:ln_end])
+                start = ln_end + 1
+
+
+def iter_matching_lines(
+    fp: Union[pathlib.Path, BinaryIO], ext: str, needle: bytes, workers: int = 1
+) -> Iterator[bytes]:
+    """Lazily yield only the decompressed lines that contain needle (case-insensitively, needle in lower case),
+    searching each buffer as a whole instead of looking at every single line"""
+    with open_dump(fp, ext, workers) as reader:
+        for buf, end in _iter_buffers(reader):
+            lowered = buf.lower()  # only lowered[:end] is valid, the rest of the buffer holds stale data
+            pos = lowered.find(needle, 0, end)
+            while pos != -1:
+                ln_start = lowered.rfind(b"\n", 0, pos) + 1
+                ln_end = lowered.find(b"\n", pos, end)
+                yield bytes(buf[ln_start:ln_end])
+                pos = lowered.find(needle, ln_end, end)
+
+
+def iter_relevant_lines(
+    fp: Union[pathlib.Path, BinaryIO], ext: str, subreddit: str, workers: int = 1
+) -> Iterator[Tuple[bytes, dict]]:
+    """Lazily yield (line, parsed object) for all lines of a dump that belong to the subreddit, only decoding
+    and parsing lines that contain the quoted subreddit name"""
+    subreddit = subreddit.lower()
+    needle = json.dumps(subreddit).encode("utf-8")
+    for ln in iter_matching_lines(fp, ext, needle, workers):
+        try:
+            ln_str = ln.decode("utf-8")
+        except UnicodeDecodeError as e:  # only drop the invalid bytes of this line
+            logging.warning(e)
+            ln_str = ln.decode("utf-8", errors="ignore")
+            ln = ln_str.encode("utf-8")
+        d = load_relevant_ln(ln_str, subreddit)
+        if d is not None:
+            yield ln, d
+
+
+def _get_tmp_path(fp: pathlib.Path) -> pathlib.Path:
+    """Host & process specific temporary name, so concurrent writers on shared storage never share a file"""
+    return fp.with_name(f"{fp.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+
+
+def _remove_files(*fps: pathlib.Path) -> None:
+    for fp in fps:
+        try:
+            fp.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _extract_lines(
+    lines: Iterator[Tuple[bytes, dict]],
+    out_fp: pathlib.Path,
+    index: bool = True,
+    compress: bool = False,
+    buffer_size: int = BUFFER_SIZE,
+) -> int:
+    """Write the lines to a temporary file first and atomically rename it (and its index) into place once
+    complete, so that out_fp never exists as a partially written file"""
+    tmp_fp = _get_tmp_path(out_fp)
+    try:
+        with JsonArrayWriter(tmp_fp, index, compress, buffer_size) as writer:
+            for ln, d in lines:
+                writer.write(ln.strip(), d["created_utc"], d["id"])
+    except BaseException:
+        _remove_files(tmp_fp, get_index_path(tmp_fp))
+        raise
+    n = writer.n
+    if n > 0:
+        if index is True:
+            os.replace(get_index_path(tmp_fp), get_index_path(out_fp))
+        else:
+            _remove_files(get_index_path(out_fp))
+        os.replace(tmp_fp, out_fp)
+        logging.info(f"Saved {n:,} lines to {out_fp.name}")
+    else:
+        _remove_files(tmp_fp, out_fp, get_index_path(out_fp))
+    return n
+
+
+def extract_from_dump(
+    prefix: str,
+    year: int,
+    month: int,
+    subreddit: str,
+    force: bool = False,
+    index: bool = True,
+    compress: bool = False,
+    workers: int = 1,
+    download: bool = False,
+    keep: bool = True,
+    buffer_size: int = BUFFER_SIZE,
+) -> bool:
     """Extract json objects for a specific subreddit for a given year and month into a single year/month file,
-    assuming the necessary dump files were downloaded beforehand"""
-    in_dn = DATA_DIR / "compressed"
-    out_dn = DATA_DIR / f"extracted/monthly/{subreddit}"
-    out_dn.mkdir(parents=True, exist_ok=True)
+    assuming the necessary dump files were downloaded beforehand. If download is True, missing dump files are
+    instead extracted while they are being downloaded (and only saved to disk if keep is True). Records are
+    written in batches of buffer_size bytes.
+    Returns False if the dump was neither downloaded nor could be downloaded, True otherwise"""
     ext = infer_extension(prefix, year, month)
     n = 0
     if prefix == "RC":
@@ -27,88 +211,46 @@ def extract_from_dump(prefix: str, year: int, month: int, subreddit: str, force:
     elif prefix == "RS":
         kind = "submissions"
     subreddit = subreddit.lower()
-    date_str = f"{year}-{str(month).zfill(2)}"
-    out_fp = out_dn / f"{prefix}_{subreddit}_{date_str}.json"
+    out_fp = get_extracted_path(prefix, year, month, subreddit, compress)
+    out_fp.parent.mkdir(parents=True, exist_ok=True)
+    is_available = True
     if force is True or not out_fp.is_file():
         ext_start = datetime.datetime.utcnow()
-        fn = f"{prefix}_{date_str}.{ext}"
-        files = [in_dn / fn]
+        files = [get_dump_path(prefix, year, month)]
         for fp in files:
             if fp.is_file():
+                import dumpindex
 
+                expected = dumpindex.get_expected_size(fp, subreddit)
+                if expected is not None and expected[0] == 0:
+                    logging.info(f"Skipping {fp.name} because its index has no {kind} for subreddit '{subreddit}'")
+                    _remove_files(out_fp, get_index_path(out_fp))  # like an extraction without any matches
+                    continue
+                elif expected is not None:
+                    logging.info(f"Expecting {expected[0]:,} {kind} for subreddit '{subreddit}' in {fp.name}")
                 logging.info(f"Extracting {kind} for subreddit '{subreddit}' from {fp} to {out_fp}")
 
-                with open(out_fp, mode="w", encoding="utf-8") as h_out:
-                    n = 0
-                    if ext == "bz2":
-                        with bz2.BZ2File(fp) as h_in:
-                            for ln in h_in:
-                                ln = ln.decode("utf-8")
-                                if is_relevant_ln(ln, subreddit) is True:
-                                    ln_str = create_ln_str_with_json_boilerplate(ln, n)
-                                    h_out.write(ln_str)
-                                    n = count_and_log(n)
-                        if n > 0:  # write final ]
-                            h_out.write("\n]")
-                    elif ext == "xz":
-                        with lzma.LZMAFile(fp) as h_in:
-                            for ln in h_in:
-                                ln = ln.decode("utf-8")
-                                if is_relevant_ln(ln, subreddit) is True:
-                                    ln_str = create_ln_str_with_json_boilerplate(ln, n)
-                                    h_out.write(ln_str)
-                                    n = count_and_log(n)
-                        if n > 0:  # write final ]
-                            h_out.write("\n]")
-                    elif ext == "zst":
-
-                        chunksize = (
-                            2 ** 23
-                        )  # 8MB per chunk to reduce the immpact of "unexpected end of data" errors until fixed
-                        with open(fp, "rb") as h_in:
-                            decomp = zstandard.ZstdDecompressor(max_window_size=2147483648)
-
-                            with decomp.stream_reader(h_in) as reader:
-                                prev_ln = ""
-                                while True:
-                                    chunk = reader.read(chunksize)
-                                    if not chunk:
-                                        break
-                                    try:
-                                        lines = chunk.decode("utf-8").split("\n")
-                                    except UnicodeDecodeError as e:
-                                        logging.warning(e)
-                                        # Attempt to ignore that segment
-                                        chunk = chunk[: e.start] + chunk[e.end :]
-                                        try:
-                                            lines = chunk.decode("utf-8").split("\n")
-                                        except UnicodeDecodeError as e:
-                                            logging.error(e)
-                                            lines = []
-
-                                    for i, ln in enumerate(lines[:-1]):
-                                        if i == 0:
-                                            ln = f"{prev_ln}{ln}"
-                                            ln = ln.strip()
-                                        if is_relevant_ln(ln, subreddit) is True:
-                                            ln_str = create_ln_str_with_json_boilerplate(ln, n)
-                                            h_out.write(ln_str)
-                                            n = count_and_log(n)
-                                        prev_ln = lines[-1]
-                                if n > 0:  # write final ]
-                                    h_out.write("\n]")
-                if n > 0:
-                    logging.info(f"Saved {n:,} lines to {out_fp.name}")
-                else:
-                    try:
-                        out_fp.unlink()
-                    except FileNotFoundError:
-                        pass
+                lines = iter_relevant_lines(fp, ext, subreddit, workers)
+                n = _extract_lines(lines, out_fp, index, compress, buffer_size)
+            elif download is True:
+                import downloading  # only needed (with urllib3) when downloading
+
+                url = downloading.get_dump_url(prefix, year, month)
+                logging.info(f"Extracting {kind} for subreddit '{subreddit}' from {url} to {out_fp} while downloading")
+                fp.parent.mkdir(parents=True, exist_ok=True)
+                with downloading.open_dump_stream(url, fp if keep is True else None) as h_in:
+                    if h_in is not None:
+                        lines = iter_relevant_lines(h_in, ext, subreddit)
+                        n = _extract_lines(lines, out_fp, index, compress, buffer_size)
+                    else:
+                        is_available = False
             else:
                 logging.warning(f"File {fp.name} not found for extraction")
+                is_available = False
         duration = str(datetime.datetime.utcnow() - ext_start).split(".")[0].zfill(8)
         logging.info(f"Extraction process of {n} lines completed after {duration}")
     else:
         logging.info(
             f"Skipping extraction to {out_fp.name} because the file already exists  (--force=True to override this)"
         )
+    return is_available
@@ -1,4 +1,5 @@
 import json
+import re
 from json.decoder import JSONDecodeError
 import pathlib
 from typing import Optional
@@ -82,13 +83,6 @@ def convert_size_to_str(file_size: int) -> str:
     return f"{file_size:,} {unit}"
 
 
-def count_and_log(n: int) -> int:
-    n += 1
-    if n % 5000 == 0:
-        logging.info(f"{n:,} lines extracted so far")
-    return n
-
-
 def infer_extension(prefix: str, year: int, month: int) -> str:
     ext = "zst"
     if prefix == "RS":
@@ -101,7 +95,8 @@ def infer_extension(prefix: str, year: int, month: int) -> str:
         return ext
 
 
-def is_relevant_ln(ln: str, subreddit: str) -> bool:
+def load_relevant_ln(ln: str, subreddit: str) -> Optional[dict]:
+    """Return the parsed JSON object if the line belongs to the subreddit, otherwise None"""
     if len(ln.strip()) > 0:
         try:
             d = json.loads(ln)
@@ -111,23 +106,42 @@ def is_relevant_ln(ln: str, subreddit: str) -> bool:
             logging.warning(ln)
         else:
             try:
-                return d["subreddit"].lower() == subreddit
+                if d["subreddit"].lower() == subreddit:
+                    return d
             except KeyError:  # Submissions from /r/Promos appear to have no subreddit field (pseudo-subreddit for ad links)
-                # there are a ton of them starting in 2004 so return False silently
+                # there are a ton of them starting in 2004 so return None silently
                 # logging.warning(f"No field 'subreddit' field found in line for https://reddit.com{d['permalink']}")
-                return False
-    else:
-        return False
+                pass
+    return None
 
 
-def create_ln_str_with_json_boilerplate(ln: str, n: int) -> str:
-    parts = []
-    if n == 0:
-        parts.append("[\n")  # write initial [ for array of json obj
-    else:
-        parts.append(",\n")  # write comma and new line before adding next
-    parts.append(ln)
-    return "".join(parts)
+def is_relevant_ln(ln: str, subreddit: str) -> bool:
+    return load_relevant_ln(ln, subreddit) is not None
+
+
+_CREATED_UTC_RE = re.compile(rb'"created_utc"\s*:\s*"?(\d+)')
+_ID_RE = re.compile(rb'"id"\s*:\s*"([0-9a-z]+)"')
+
+
+def scan_created_utc(buf, start: int = 0, end: Optional[int] = None) -> int:
+    """Get the created_utc value of the JSON object in buf[start:end] without parsing the whole object"""
+    if end is None:
+        end = len(buf)
+    matches = _CREATED_UTC_RE.findall(buf, start, end)
+    if len(matches) == 1:
+        return int(matches[0])
+    # nested objects (e.g. crosspost_parent_list) carry their own created_utc, so fall back to parsing
+    return int(float(json.loads(buf[start:end])["created_utc"]))
+
+
+def scan_id(buf, start: int = 0, end: Optional[int] = None) -> str:
+    """Get the (base36) id value of the JSON object in buf[start:end] without parsing the whole object"""
+    if end is None:
+        end = len(buf)
+    matches = _ID_RE.findall(buf, start, end)
+    if len(matches) == 1:
+        return matches[0].decode("ascii")
+    return json.loads(buf[start:end])["id"]
 
 
 def is_json_line(ln: str) -> bool:
@@ -0,0 +1,139 @@
+import array
+import bisect
+import itertools
+import json
+import os
+import pathlib
+import struct
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+
+def get_index_path(fp: pathlib.Path) -> pathlib.Path:
+    return fp.with_name(f"{fp.name}.idx")
+
+
+def _open_data_file(fp: pathlib.Path) -> BinaryIO:
+    if fp.suffix == ".zst":
+        from compression import open_extracted
+
+        return open_extracted(fp)
+    return open(fp, "rb")
+
+
+class RecordIndex:
+    """Sidecar index of an extracted (or split) JSON file, holding the byte offset & length of each record
+    together with its created_utc and its id (base36-decoded), each as a compact array in file order"""
+
+    HEADER = struct.Struct("<4sHQ")
+    MAGIC = b"PSIX"
+    VERSION = 1
+
+    def __init__(self) -> None:
+        self.offsets = array.array("Q")
+        self.lengths = array.array("I")
+        self.created = array.array("q")
+        self.ids = array.array("Q")
+        self._bounds = None
+        self._id_lookup = None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def append(self, offset: int, length: int, created_utc: int, item_id: str) -> None:
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.created.append(created_utc)
+        self.ids.append(int(item_id, 36))
+
+    def save(self, fp: pathlib.Path) -> None:
+        tmp_fp = fp.with_name(f"{fp.name}.tmp")
+        with open(tmp_fp, "wb") as h_out:
+            h_out.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(self)))
+            for arr in (self.offsets, self.lengths, self.created, self.ids):
+                h_out.write(arr.tobytes())
+        os.replace(tmp_fp, fp)
+
+    @classmethod
+    def load(cls, fp: pathlib.Path) -> "RecordIndex":
+        idx = cls()
+        with open(fp, "rb") as h_in:
+            magic, version, n = cls.HEADER.unpack(h_in.read(cls.HEADER.size))
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ValueError(f"{fp} is not a valid record index")
+            for arr in (idx.offsets, idx.lengths, idx.created, idx.ids):
+                arr.fromfile(h_in, n)
+        return idx
+
+    @classmethod
+    def for_file(cls, data_fp: pathlib.Path) -> "RecordIndex":
+        return cls.load(get_index_path(data_fp))
+
+    def _get_bounds(self) -> Tuple[list, list]:
+        # Records are only roughly ordered by time, so keep a running maximum and a reversed running minimum
+        # of created_utc to find the (tight) window of positions that can contain a given time range
+        if self._bounds is None:
+            running_max = list(itertools.accumulate(self.created, max))
+            running_min = list(itertools.accumulate(reversed(self.created), min))
+            running_min.reverse()
+            self._bounds = (running_max, running_min)
+        return self._bounds
+
+    def find_time_range(self, since: int, until: int) -> List[int]:
+        """Positions of all records with since <= created_utc <= until, in file order"""
+        running_max, running_min = self._get_bounds()
+        lo = bisect.bisect_left(running_max, since)
+        hi = bisect.bisect_right(running_min, until)
+        return [i for i in range(lo, hi) if since <= self.created[i] <= until]
+
+    def _get_id_lookup(self) -> Tuple[array.array, array.array]:
+        # The ids sorted for bisection together with their positions in file order (the first one of duplicates)
+        if self._id_lookup is None:
+            order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+            self._id_lookup = (array.array("Q", (self.ids[i] for i in order)), array.array("Q", order))
+        return self._id_lookup
+
+    def find_id(self, item_id: str) -> Optional[int]:
+        if "_" in item_id:  # fullnames such as t1_abc123
+            item_id = item_id.split("_", 1)[1]
+        key = int(item_id, 36)
+        sorted_ids, positions = self._get_id_lookup()
+        i = bisect.bisect_left(sorted_ids, key)
+        if i < len(sorted_ids) and sorted_ids[i] == key:
+            return positions[i]
+        return None
+
+    def partition(self, n_parts: int) -> List[Tuple[int, int]]:
+        """Split the file into up to n_parts byte ranges of roughly equal size that start and end at
+        record boundaries, e.g. to read them in parallel with read_byte_range"""
+        n = len(self)
+        if n == 0:
+            return []
+        end = self.offsets[-1] + self.lengths[-1]
+        step = (end - self.offsets[0]) / max(1, n_parts)
+        starts = [0]
+        for part in range(1, n_parts):
+            i = bisect.bisect_left(self.offsets, self.offsets[0] + part * step)
+            if starts[-1] < i < n:
+                starts.append(i)
+        ranges = []
+        for a, b in zip(starts, starts[1:] + [n]):
+            ranges.append((self.offsets[a], self.offsets[b - 1] + self.lengths[b - 1]))
+        return ranges
+
+    def read_records(self, data_fp: pathlib.Path, positions: List[int]) -> Iterator[dict]:
+        if data_fp.suffix == ".zst":
+            positions = sorted(positions)  # compressed files can only be read forward
+        with _open_data_file(data_fp) as h_in:
+            for i in positions:
+                h_in.seek(self.offsets[i])
+                yield json.loads(h_in.read(self.lengths[i]))
+
+
+def read_byte_range(data_fp: pathlib.Path, start: int, end: int) -> Iterator[dict]:
+    """Parse all records of an extracted file within a byte range as returned by RecordIndex.partition"""
+    with _open_data_file(data_fp) as h_in:
+        h_in.seek(start)
+        for ln in h_in.read(end - start).split(b"\n"):
+            ln = ln.strip().rstrip(b",")
+            if len(ln) > 0 and ln not in (b"[", b"]"):
+                yield json.loads(ln)
@@ -2,67 +2,141 @@ import logging
 import json
 import datetime
 import pathlib
+import mmap
+import io
 from typing import Optional
-from config import DATA_DIR
-from helpers import count_and_log, is_json_line, create_ln_str_with_json_boilerplate, get_file_size_info_str
+from config import get_data_dir
+from compression import open_extracted
+from helpers import get_file_size_info_str, scan_created_utc, scan_id
+from writing import BUFFER_SIZE, JsonArrayWriter
 
 
-def _split_extracted_at_once(in_fp: pathlib.Path, prefix: str, subreddit: str):
-    out_sub_dn = DATA_DIR / f"extracted/daily/{subreddit}"
+READ_SIZE = 2 ** 20  # 1MB
 
+
+def _get_daily_path(prefix: str, subreddit: str, day: datetime.date, compress: bool = False) -> pathlib.Path:
+    ext = "json.zst" if compress is True else "json"
+    return get_data_dir() / f"extracted/daily/{subreddit}" / f"{prefix}_{subreddit}_{day.isoformat()}.{ext}"
+
+
+def _split_extracted_at_once(
+    in_fp: pathlib.Path,
+    prefix: str,
+    subreddit: str,
+    index: bool = True,
+    compress: bool = False,
+    buffer_size: int = BUFFER_SIZE,
+):
     data = json.loads(in_fp.read_text())
+    writer = None
     cur_day = None
-    cur_data = []
     for d in data:
         day = datetime.datetime.utcfromtimestamp(int(d["created_utc"])).date()
         if day != cur_day:
-            if len(cur_data) > 0:
-                out_fp = out_sub_dn / f"{prefix}_{subreddit}_{cur_day.isoformat()}.json"
-                out_fp.write_text(json.dumps(cur_data))
-                cur_data = []
+            if writer is not None:
+                writer.close()
+            out_fp = _get_daily_path(prefix, subreddit, day, compress)
+            writer = JsonArrayWriter(out_fp, index, compress, buffer_size)
             cur_day = day
-        cur_data.append(d)
-    if len(cur_data) > 0:
-        out_fp = out_sub_dn / f"{prefix}_{subreddit}_{cur_day.isoformat()}.json"
-        out_fp.write_text(json.dumps(cur_data, indent=4))
+        writer.write(json.dumps(d).encode("utf-8"), d["created_utc"], d["id"])
+    if writer is not None:
+        writer.close()
 
 
-def _split_extracted_by_streaming(in_fp: pathlib.Path, prefix: str, subreddit: str):
-    out_sub_dn = DATA_DIR / f"extracted/daily/{subreddit}"
-
-    with open(in_fp, mode="r", encoding="utf-8") as h_in:
-        h_out = None
+def _split_extracted_by_streaming(
+    in_fp: pathlib.Path,
+    prefix: str,
+    subreddit: str,
+    index: bool = True,
+    compress: bool = False,
+    buffer_size: int = BUFFER_SIZE,
+):
+    with io.BufferedReader(open_extracted(in_fp), buffer_size=READ_SIZE) as h_in:
+        writer = None
         cur_day = None
-        for ln in h_in:
-            if is_json_line(ln):
-                ln = ln.strip().strip(",").strip()  # remove whitespace and trailing comma
+        for ln in h_in:  # keep the lines as bytes, so they are written without decoding & encoding them again
+            ln = ln.strip().strip(b",").strip()  # remove whitespace and trailing comma
+            if len(ln) > 0 and ln not in (b"[", b"]"):  # skip empty lines and start / end of array
                 d = json.loads(ln)
                 day = datetime.datetime.utcfromtimestamp(int(d["created_utc"])).date()
                 if day != cur_day:
-                    if h_out is not None:
-                        if n > 0:  # write final ]
-                            h_out.write("\n]")
-                        h_out.close()
-                    out_fp = out_sub_dn / f"{prefix}_{subreddit}_{day.isoformat()}.json"
-                    n = 0
-                    h_out = open(out_fp, mode="w", encoding="utf-8")
+                    if writer is not None:
+                        writer.close()
+                    out_fp = _get_daily_path(prefix, subreddit, day, compress)
+                    writer = JsonArrayWriter(out_fp, index, compress, buffer_size)
                     cur_day = day
-                ln_str = create_ln_str_with_json_boilerplate(ln, n)
-                h_out.write(ln_str)
-                n = count_and_log(n)
-        if h_out is not None:
-            if n > 0:  # write final ]
-                h_out.write("\n]")
-            h_out.close()
+                writer.write(ln, d["created_utc"], d["id"])
+        if writer is not None:
+            writer.close()
+
+
+def _split_extracted_mmap(
+    in_fp: pathlib.Path,
+    prefix: str,
+    subreddit: str,
+    index: bool = True,
+    compress: bool = False,
+    buffer_size: int = BUFFER_SIZE,
+):
+    """Copy the original bytes of each record into the daily files, only scanning each line for created_utc"""
+    with open(in_fp, mode="rb") as h_in:
+        if in_fp.stat().st_size == 0:  # empty files can't be mapped
+            return
+        with mmap.mmap(h_in.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+            writer = None
+            cur_day = None
+            try:  # the batch holds slices of mv, which must be released before mv can be closed
+                size = len(mm)
+                pos = 0
+                while pos < size:
+                    ln_end = mm.find(b"\n", pos)
+                    if ln_end == -1:
+                        ln_end = size
+                    start, end = pos, ln_end
+                    pos = ln_end + 1
+                    while start < end and mm[start] in b" \t\r":
+                        start += 1
+                    if start == end or mm[start] in b"[]":  # empty line or start / end of array
+                        continue
+                    while end > start and mm[end - 1] in b" \t\r,":  # remove whitespace and trailing comma
+                        end -= 1
+                    created_utc = scan_created_utc(mm, start, end)
+                    day = datetime.datetime.utcfromtimestamp(created_utc).date()
+                    if day != cur_day:
+                        if writer is not None:
+                            writer.close()
+                        out_fp = _get_daily_path(prefix, subreddit, day, compress)
+                        writer = JsonArrayWriter(out_fp, index, compress, buffer_size)
+                        cur_day = day
+                    item_id = scan_id(mm, start, end) if index is True else ""
+                    writer.write(mv[start:end], created_utc, item_id)
+            except BaseException:
+                if writer is not None:
+                    writer.discard()
+                raise
+            if writer is not None:
+                writer.close()
 
 
-def split_extracted(prefix: str, year: int, month: int, subreddit: str, stream_threshold: int = 500) -> None:
+def split_extracted(
+    prefix: str,
+    year: int,
+    month: int,
+    subreddit: str,
+    stream_threshold: int = 500,
+    use_mmap: bool = False,
+    index: bool = True,
+    compress: bool = False,
+    buffer_size: int = BUFFER_SIZE,
+) -> None:
     """Split extracted subreddit/year/month files further by day"""
     subreddit = subreddit.lower()
-    in_sub_dn = DATA_DIR / f"extracted/monthly/{subreddit}"
-    out_sub_dn = DATA_DIR / f"extracted/daily/{subreddit}"
+    in_sub_dn = get_data_dir() / f"extracted/monthly/{subreddit}"
+    out_sub_dn = get_data_dir() / f"extracted/daily/{subreddit}"
     out_sub_dn.mkdir(parents=True, exist_ok=True)
     in_fp = in_sub_dn / f"{prefix}_{subreddit}_{year}-{str(month).zfill(2)}.json"
+    if not in_fp.is_file() and in_fp.with_suffix(".json.zst").is_file():
+        in_fp = in_fp.with_suffix(".json.zst")
     split_start = datetime.datetime.utcnow()
     try:
         file_size = in_fp.stat().st_size
@@ -74,10 +148,14 @@ def split_extracted(prefix: str, year: int, month: int, subreddit: str, stream_t
         logging.info(f"Splitting '{in_fp}' ({get_file_size_info_str(in_fp)}) into daily files")
         file_size = file_size / 1024 / 1024
         # if file size (in MB) is great than stream_threshold (default 500MB), then stream read & write the file(s) line by line
-        if file_size > stream_threshold:
-            _split_extracted_by_streaming(in_fp, prefix, subreddit)
+        if in_fp.suffix == ".zst":  # compressed files can only be streamed
+            _split_extracted_by_streaming(in_fp, prefix, subreddit, index, compress, buffer_size)
+        elif use_mmap is True:  # memory stays flat regardless of the file size
+            _split_extracted_mmap(in_fp, prefix, subreddit, index, compress, buffer_size)
+        elif file_size > stream_threshold:
+            _split_extracted_by_streaming(in_fp, prefix, subreddit, index, compress, buffer_size)
         else:
-            _split_extracted_at_once(in_fp, prefix, subreddit)
+            _split_extracted_at_once(in_fp, prefix, subreddit, index, compress, buffer_size)
 
         duration = str(datetime.datetime.utcnow() - split_start).split(".")[0].zfill(8)
         logging.info(f"Splitting process completed after {duration}")
@@ -0,0 +1,92 @@
+import io
+import json
+import logging
+import pathlib
+from typing import Iterator, Optional, Union, List
+from helpers import AbstractTool, infer_extension, is_json_line
+from extraction import get_dump_path, get_extracted_path, iter_dump_lines, iter_relevant_lines
+from compression import open_extracted
+
+
+def _iter_extracted_records(fp: pathlib.Path) -> Iterator[dict]:
+    with io.TextIOWrapper(open_extracted(fp), encoding="utf-8") as h_in:
+        for ln in h_in:
+            if is_json_line(ln):
+                yield json.loads(ln.strip().strip(",").strip())  # remove whitespace and trailing comma
+
+
+def _iter_dump_records(fp: pathlib.Path, ext: str, subreddit: Optional[str]) -> Iterator[dict]:
+    if subreddit is not None:
+        for _, d in iter_relevant_lines(fp, ext, subreddit):
+            yield d
+    else:
+        for ln in iter_dump_lines(fp, ext):
+            if len(ln.strip()) == 0:
+                continue
+            try:
+                ln = ln.decode("utf-8")
+            except UnicodeDecodeError as e:  # only drop the invalid bytes of this line
+                logging.warning(e)
+                ln = ln.decode("utf-8", errors="ignore")
+            try:
+                d = json.loads(ln)
+            except json.JSONDecodeError as e:  # skip the line like load_relevant_ln does
+                logging.error("JSON DECODE ERROR")
+                logging.error(e)
+                logging.warning(ln)
+                continue
+            yield d
+
+
+def _iter_period_records(prefix: str, year: int, month: int, subreddit: Optional[str], source: str) -> Iterator[dict]:
+    if subreddit is not None and source in ("auto", "extracted"):
+        for compress in (False, True):
+            fp = get_extracted_path(prefix, year, month, subreddit, compress)
+            if fp.is_file():
+                yield from _iter_extracted_records(fp)
+                return
+        if source == "extracted":
+            logging.warning(f"File {fp.name} not found for reading")
+            return
+    fp = get_dump_path(prefix, year, month)
+    if fp.is_file():
+        yield from _iter_dump_records(fp, infer_extension(prefix, year, month), subreddit)
+    else:
+        logging.warning(f"File {fp.name} not found for reading")
+
+
+def iter_records(
+    prefix: str,
+    since: Union[str, int],
+    until: Union[str, int, None] = None,
+    subreddit: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    batch_size: Optional[int] = None,
+    source: str = "auto",
+) -> Iterator[Union[dict, List[dict]]]:
+    """Lazily yield the records (as dicts) of all months from since to until, straight from the compressed dumps
+    or from previously extracted subreddit files (source 'dump', 'extracted' or 'auto' to prefer extracted files).
+    If fields is given, only these keys are kept. If batch_size is given, lists of up to batch_size records are
+    yielded instead of single records"""
+    if prefix not in ("RC", "RS"):
+        raise ValueError("Invalid value for 'prefix'")
+    if source not in ("auto", "dump", "extracted"):
+        raise ValueError("Invalid value for 'source'")
+    if subreddit is not None:
+        subreddit = subreddit.lower().strip()
+    dates = AbstractTool()
+    dates._initialize_dates(since, until)
+    batch = []
+    for year, month in dates.periods:
+        for d in _iter_period_records(prefix, year, month, subreddit, source):
+            if fields is not None:
+                d = {k: d.get(k) for k in fields}
+            if batch_size is None:
+                yield d
+            else:
+                batch.append(d)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if len(batch) > 0:
+        yield batch
@@ -0,0 +1,280 @@
+import logging
+import lzma
+import math
+import pathlib
+import random
+from typing import Iterator, List, Optional, Tuple
+import decompression
+from extraction import _ChunkReader, _extract_lines, get_dump_path, get_extracted_path, iter_relevant_lines
+from helpers import infer_extension
+from writing import BUFFER_SIZE
+
+
+Z_95 = 1.96  # z-score of a two-sided 95% confidence interval
+PREFIX_READ_SIZE = 2 ** 20  # 1MB
+
+
+def get_sample_path(
+    prefix: str, year: int, month: int, subreddit: str, fraction: float, compress: bool = False
+) -> pathlib.Path:
+    """Sampled extractions get their own file name so they are never mistaken for complete ones"""
+    fp = get_extracted_path(prefix, year, month, subreddit, compress)
+    ext = "json.zst" if compress is True else "json"
+    return fp.with_name(f"{prefix}_{subreddit}_{year}-{str(month).zfill(2)}_sample{fraction:g}.{ext}")
+
+
+def _locate_units(fp: pathlib.Path, ext: str) -> Tuple[object, List[tuple], List[int]]:
+    """The independently decompressible units of a dump as (decompression function, tasks, compressed size of
+    each task), i.e. bz2 blocks (sized in bits), xz blocks or zstd frames"""
+    if fp.stat().st_size == 0:  # can't be memory-mapped and has no units anyway
+        return None, [], []
+    if ext == "bz2":
+        tasks = decompression._locate_bz2_blocks(fp)
+        return decompression._decompress_bz2_segment, tasks, [end - start for start, end in tasks]
+    elif ext == "xz":
+        tasks = decompression._locate_xz_blocks(fp)
+        return decompression._decompress_xz_block, tasks, [t[2] for t in tasks]
+    elif ext == "zst":
+        tasks = decompression._locate_zst_frames(fp)
+        return decompression._decompress_zst_frame, tasks, [t[1] for t in tasks]
+    raise ValueError(f"Unsupported file extension '{ext}'")
+
+
+def _choose_units(n_units: int, fraction: float, seed: Optional[int] = None) -> List[int]:
+    """Systematic sample (every k-th unit from a random start) so the sample is spread out over the whole
+    month, with at least two units to be able to estimate the sampling error"""
+    if n_units == 0:
+        return []
+    n = min(n_units, max(2, math.ceil(n_units * fraction)))
+    step = n_units / n
+    start = random.Random(seed).uniform(0, step)
+    return [int(start + i * step) for i in range(n)]
+
+
+def _trim_partial_lines(chunk: bytes, is_first: bool, is_last: bool) -> Tuple[bytes, bytes]:
+    """Units don't end at line boundaries, so split off the partial lines at either edge. Returns the complete
+    lines and the partial last line, which completes the first line of the next unit if that is sampled too"""
+    start, end = 0, len(chunk)
+    if is_first is False:
+        start = chunk.find(b"\n") + 1
+        if start == 0:  # no line boundary in the whole unit
+            return b"", b""
+    if is_last is False:
+        end = chunk.rfind(b"\n") + 1
+    return chunk[start:end], chunk[end:]
+
+
+def _iter_prefix_chunks(fp: pathlib.Path, ext: str, limit: int) -> Iterator[bytes]:
+    """Decompress only the first limit bytes of a dump that can't be split, yielding complete lines only"""
+    if ext == "zst":
+        import zstandard
+
+        decomp = zstandard.ZstdDecompressor(max_window_size=decompression.ZST_MAX_WINDOW_SIZE).decompressobj()
+    else:
+        decomp = lzma.LZMADecompressor()
+    tail = b""
+    with open(fp, mode="rb") as h_in:
+        while h_in.tell() < limit:
+            data = h_in.read(min(PREFIX_READ_SIZE, limit - h_in.tell()))
+            if not data:
+                break
+            chunk = tail + decomp.decompress(data)
+            end = chunk.rfind(b"\n") + 1
+            tail = chunk[end:]
+            yield chunk[:end]
+    if limit >= fp.stat().st_size and len(tail) > 0:  # last line without trailing newline
+        yield tail + b"\n"
+
+
+def estimate_total(values: List[int], sizes: List[int], total_size: int, n_units: int) -> Tuple[float, float]:
+    """Ratio estimate of a total over all units from the values of the sampled units, using the compressed size
+    (which is known for all units) as auxiliary variable, together with the half-width of its 95% confidence
+    interval (nan if it can't be estimated)"""
+    n = len(values)
+    if n == 0 or sum(sizes) == 0:
+        return 0.0, math.nan
+    ratio = sum(values) / sum(sizes)
+    total = ratio * total_size
+    if n >= n_units:
+        return total, 0.0
+    if n < 2:
+        return total, math.nan
+    s2 = sum((v - ratio * x) ** 2 for v, x in zip(values, sizes)) / (n - 1)
+    se = n_units * math.sqrt((1 - n / n_units) * s2 / n)
+    return total, Z_95 * se
+
+
+class DumpSample:
+    """A spread-out sample of a dump that decompresses only the sampled bz2/xz blocks or zstd frames and skips
+    all others. Dumps that consist of a single block/frame can't be skipped through, so their leading fraction
+    is read instead, which gives a biased estimate (without an error bound)"""
+
+    def __init__(
+        self, fp: pathlib.Path, ext: str, fraction: float, workers: int = 1, seed: Optional[int] = None
+    ) -> None:
+        if not 0 < fraction <= 1:
+            raise ValueError(f"The sample fraction must be within (0, 1], not {fraction}")
+        self.fp = fp
+        self.ext = ext
+        self.fraction = fraction
+        self.workers = workers
+        self.func, self.tasks, self.unit_sizes = _locate_units(fp, ext)
+        # bz2 blocks are at most 900KB, and an empty file has nothing to read
+        self.is_prefix = len(self.tasks) == 1 and ext != "bz2"
+        if self.is_prefix is True:
+            self.total_size = fp.stat().st_size
+            self.n_units = 1
+            self.chosen = []
+        else:
+            self.total_size = sum(self.unit_sizes)
+            self.n_units = len(self.tasks)
+            self.chosen = _choose_units(self.n_units, fraction, seed)
+        self.sizes, self.matches, self.lines = [], [], []
+
+    def is_empty(self) -> bool:
+        """True if no units were found at all, e.g. for an empty or truncated dump"""
+        if self.n_units == 0:
+            logging.warning(f"No {self.ext} blocks/frames found in {self.fp.name} (empty or truncated file), skipping it")
+            return True
+        return False
+
+    def _iter_units(self) -> Iterator[Tuple[int, Iterator[bytes]]]:
+        """Yield (compressed size, decompressed chunks of complete lines) for each sampled unit"""
+        if self.is_prefix is True:
+            limit = min(self.total_size, math.ceil(self.total_size * self.fraction))
+            logging.warning(
+                f"{self.fp.name} consists of a single {self.ext} block/frame, so only its first {limit:,} bytes "
+                f"are sampled and the estimate may be biased"
+            )
+            yield limit, _iter_prefix_chunks(self.fp, self.ext, limit)
+            return
+        tasks = [self.tasks[i] for i in self.chosen]
+        if self.workers > 1:
+            results = decompression._iter_parallel_results(self.func, self.fp, tasks, self.workers)
+        else:
+            results = ((task, self.func(str(self.fp), *task)) for task in tasks)
+        prev, tail = None, b""
+        for i, (_, chunk) in zip(self.chosen, results):
+            if chunk is None:  # a false bz2 block magic split a real block, leave it out of the sample
+                logging.warning(f"Unable to decompress sampled block {i} of {self.fp.name}, skipping it")
+                prev = None
+                continue
+            is_continued = prev == i - 1
+            if is_continued is True:
+                chunk = tail + chunk
+            chunk, tail = _trim_partial_lines(chunk, i == 0 or is_continued, i == self.n_units - 1)
+            prev = i
+            yield self.unit_sizes[i], iter([chunk])
+
+    def iter_relevant_lines(self, subreddit: str) -> Iterator[Tuple[bytes, dict]]:
+        """Yield (line, parsed object) for the lines of the sampled units that belong to the subreddit,
+        keeping count of them (and of all lines) per unit for the estimates"""
+        for size, chunks in self._iter_units():
+            counts = [0, 0]  # matching lines, all lines
+
+            def count_lines(chunks: Iterator[bytes]) -> Iterator[bytes]:
+                for chunk in chunks:
+                    counts[1] += chunk.count(b"\n")
+                    yield chunk
+
+            for ln, d in iter_relevant_lines(_ChunkReader(count_lines(chunks)), "json", subreddit):
+                counts[0] += 1
+                yield ln, d
+            self.sizes.append(size)
+            self.matches.append(counts[0])
+            self.lines.append(counts[1])
+
+    def estimate(self, values: List[int]) -> Tuple[float, float]:
+        if self.is_prefix is True:
+            if len(self.sizes) == 0 or self.sizes[0] == 0:
+                return 0.0, math.nan
+            return sum(values) * self.total_size / self.sizes[0], 0.0 if self.sizes[0] >= self.total_size else math.nan
+        return estimate_total(values, self.sizes, self.total_size, self.n_units)
+
+    def describe(self) -> str:
+        if self.is_prefix is True:
+            return f"first {self.sizes[0] / self.total_size:.1%} of {self.fp.name}" if len(self.sizes) > 0 else ""
+        unit = "frames" if self.ext == "zst" else "blocks"
+        return f"{len(self.sizes):,} of {self.n_units:,} {self.ext} {unit} of {self.fp.name}"
+
+
+def _format_estimate(total: float, ci: float) -> str:
+    if math.isnan(ci):
+        return f"~{total:,.0f} (no error bound)"
+    elif ci == 0:
+        return f"{total:,.0f}"
+    return f"~{total:,.0f} ± {ci:,.0f}"
+
+
+def sample_dump(
+    prefix: str, year: int, month: int, subreddit: str, fraction: float, workers: int = 1
+) -> Optional[DumpSample]:
+    """Count the subreddit's lines in a sample of a downloaded dump"""
+    ext = infer_extension(prefix, year, month)
+    fp = get_dump_path(prefix, year, month)
+    if not fp.is_file():
+        logging.warning(f"File {fp.name} not found for sampling")
+        return None
+    sample = DumpSample(fp, ext, fraction, workers)
+    if sample.is_empty() is True:
+        return None
+    for _ in sample.iter_relevant_lines(subreddit.lower()):
+        pass
+    return sample
+
+
+def estimate_counts(prefix: str, periods: List[tuple], subreddit: str, fraction: float, workers: int = 1) -> None:
+    """Log the estimated number of the subreddit's lines (and of all lines) per month with 95% confidence
+    intervals, as well as the overall estimate"""
+    kind = "comments" if prefix == "RC" else "submissions"
+    total, total_var = 0.0, 0.0
+    for year, month in periods:
+        sample = sample_dump(prefix, year, month, subreddit, fraction, workers)
+        if sample is None:
+            continue
+        matches, matches_ci = sample.estimate(sample.matches)
+        lines, lines_ci = sample.estimate(sample.lines)
+        total += matches
+        total_var += (matches_ci / Z_95) ** 2  # the months are sampled independently
+        logging.info(
+            f"{year}-{str(month).zfill(2)}: {_format_estimate(matches, matches_ci)} {kind} in '{subreddit}' "
+            f"of {_format_estimate(lines, lines_ci)} {kind} in total (95% CI, sampled {sample.describe()})"
+        )
+    logging.info(f"Total: {_format_estimate(total, Z_95 * math.sqrt(total_var))} {kind} in '{subreddit}'")
+
+
+def extract_sample(
+    prefix: str,
+    year: int,
+    month: int,
+    subreddit: str,
+    fraction: float,
+    force: bool = False,
+    index: bool = True,
+    compress: bool = False,
+    workers: int = 1,
+    buffer_size: int = BUFFER_SIZE,
+) -> None:
+    """Extract the subreddit's lines from a sample of a downloaded dump into a separate _sample file"""
+    ext = infer_extension(prefix, year, month)
+    fp = get_dump_path(prefix, year, month)
+    subreddit = subreddit.lower()
+    out_fp = get_sample_path(prefix, year, month, subreddit, fraction, compress)
+    out_fp.parent.mkdir(parents=True, exist_ok=True)
+    if force is False and out_fp.is_file():
+        logging.info(
+            f"Skipping sampling to {out_fp.name} because the file already exists (--force=True to override this)"
+        )
+        return
+    if not fp.is_file():
+        logging.warning(f"File {fp.name} not found for sampling")
+        return
+    logging.info(f"Extracting a {fraction:.1%} sample for subreddit '{subreddit}' from {fp} to {out_fp}")
+    sample = DumpSample(fp, ext, fraction, workers)
+    if sample.is_empty() is True:
+        return
+    _extract_lines(sample.iter_relevant_lines(subreddit), out_fp, index, compress, buffer_size)
+    matches, matches_ci = sample.estimate(sample.matches)
+    logging.info(
+        f"Estimated {_format_estimate(matches, matches_ci)} lines in the full dump (sampled {sample.describe()})"
+    )
@@ -2,8 +2,11 @@ import json
 import logging
 import pathlib
 import datetime
+from typing import Optional
 from prawtools import PrawJsonEncoder, authenticate_with_praw
-from config import LOCAL_CONFIG_FP, DATA_DIR
+from dedup import SeenIdStore
+from compression import compress_bytes, get_prefix_for_path, load_dictionary
+from config import load_local_config, get_data_dir
 
 
 class StreamTool:
@@ -11,7 +14,7 @@ class StreamTool:
         self.reddit = None
 
     def _check_auth_info(self) -> None:
-        d = json.loads(LOCAL_CONFIG_FP.read_text())
+        d = load_local_config()
         problem = False
         try:
             if len(d["auth"].keys()) == 0:
@@ -37,7 +40,7 @@ class StreamTool:
     ) -> pathlib.Path:
         now = datetime.datetime.utcnow()
         dstr = now.strftime("%Y%m%d")
-        dn = DATA_DIR / "streamed" / subreddit / dstr
+        dn = get_data_dir() / "streamed" / subreddit / dstr
         dn.mkdir(parents=True, exist_ok=True)
         ts = int(now.timestamp())
         if only_id is True:
@@ -46,6 +49,23 @@ class StreamTool:
             fp = dn / f"{prefix}_{subreddit}_{ts}"
         return fp
 
+    @staticmethod
+    def _write_chunk(fp: pathlib.Path, data: list, compress: bool = False) -> None:
+        if compress is True:  # small chunks compress poorly on their own, so use the trained dictionary
+            fp = fp.with_name(f"{fp.name}.zst")
+            fp.write_bytes(compress_bytes("\n".join(data).encode("utf-8"), get_prefix_for_path(fp)))
+        else:
+            fp.write_text("\n".join(data))
+
+    @staticmethod
+    def _get_seen_store(prefix: str, subreddit: str, dedupe: bool, retention_days: float) -> Optional[SeenIdStore]:
+        if dedupe is False:
+            return None
+        fp = get_data_dir() / "streamed" / subreddit / f"{prefix}_seen_ids.bin"
+        seen = SeenIdStore(fp, retention_days)
+        logging.info(f"Loaded {len(seen):,} previously streamed ids for deduplication")
+        return seen
+
     def submissions(
         self,
         subreddit: str,
@@ -53,12 +73,19 @@ class StreamTool:
         skip_existing: bool = False,
         chunksize: int = 100,
         max_chunk_duration=300,
+        dedupe: bool = True,
+        retention_days: float = 7,
+        compress: bool = False,
     ):
         self._check_auth_info()
+        if compress is True:  # fail right away instead of after the first chunk if no dictionary is trained yet
+            load_dictionary("RS")
         subreddit = subreddit.lower().strip()
         self.reddit = authenticate_with_praw(self.credentials)
         logging.info(f"Streaming submissions in subreddit '{subreddit}'")
+        seen = self._get_seen_store("rs", subreddit, dedupe, retention_days)
         data = []
+        pending = []  # ids of items not yet written to disk
         i = 0
         last_saved = (
             datetime.datetime.utcnow()
@@ -67,6 +94,10 @@ class StreamTool:
         for submission in self.reddit.subreddit(subreddit).stream.submissions(
             skip_existing=skip_existing
         ):
+            if seen is not None:
+                if submission.id in seen:  # replayed by PRAW after a restart, already written
+                    continue
+                pending.append(submission.id)
             if only_id is True:
                 data.append(submission.id)
             else:
@@ -76,8 +107,12 @@ class StreamTool:
             if duration > max_chunk_duration or i >= chunksize:
                 if len(data) > 0:
                     fp = self._get_output_path("rs", subreddit, only_id)
-                    fp.write_text("\n".join(data))
+                    self._write_chunk(fp, data, compress)
                     data = []
+                    if seen is not None:
+                        seen.update(pending)
+                        seen.save()
+                        pending = []
                     logging.info(fp.name)
                     i = 0
 
@@ -88,12 +123,19 @@ class StreamTool:
         skip_existing: bool = False,
         chunksize: int = 100,
         max_chunk_duration=300,
+        dedupe: bool = True,
+        retention_days: float = 7,
+        compress: bool = False,
     ):
         self._check_auth_info()
+        if compress is True:  # fail right away instead of after the first chunk if no dictionary is trained yet
+            load_dictionary("RC")
         subreddit = subreddit.lower().strip()
         self.reddit = authenticate_with_praw(self.credentials)
         logging.info(f"Streaming comments in subreddit '{subreddit}'")
+        seen = self._get_seen_store("rc", subreddit, dedupe, retention_days)
         data = []
+        pending = []  # ids of items not yet written to disk
         i = 0
         last_saved = (
             datetime.datetime.utcnow()
@@ -101,6 +143,10 @@ class StreamTool:
         for comment in self.reddit.subreddit(subreddit).stream.comments(
             skip_existing=skip_existing
         ):
+            if seen is not None:
+                if comment.id in seen:  # replayed by PRAW after a restart, already written
+                    continue
+                pending.append(comment.id)
             if only_id is True:
                 data.append(comment.id)
             else:
@@ -110,8 +156,12 @@ class StreamTool:
             if duration > max_chunk_duration or i >= chunksize:
                 if len(data) > 0:
                     fp = self._get_output_path("rc", subreddit, only_id)
-                    fp.write_text("\n".join(data))
+                    self._write_chunk(fp, data, compress)
                     data = []
+                    if seen is not None:
+                        seen.update(pending)
+                        seen.save()
+                        pending = []
                     logging.info(fp.name)
                     i = 0
                     last_saved = datetime.datetime.utcnow()
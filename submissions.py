@@ -1,10 +1,6 @@
 from helpers import AbstractTool
-from typing import Union
+from typing import Union, Optional
 import logging
-import downloading
-import extraction
-import processing
-import verification
 
 
 class SubmissionTool(AbstractTool):
@@ -18,6 +14,7 @@ class SubmissionTool(AbstractTool):
         retry: bool = False,
         max_attempts: int = 3,
     ) -> None:
+        import downloading
         self._initialize_dates(since, until)
         logging.info(f"Downloading available submission dumps from {self._get_date_range_str()}")
         for p in self.periods:
@@ -33,28 +30,163 @@ class SubmissionTool(AbstractTool):
             )
 
     def extract(
-        self, since: Union[str, int], until: Union[str, int, None], subreddit: str, force: bool = False
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        force: bool = False,
+        index: bool = True,
+        compress: bool = False,
+        workers: int = 1,
+        download: bool = False,
+        keep: bool = True,
+        sample: Optional[float] = None,
+        buffer_size: int = 2 ** 23,
     ) -> None:
+        import dumpindex
+        import extraction
         self._initialize_dates(since, until)
         subreddit = subreddit.lower().strip()
+        if sample is not None:
+            import sampling
+            logging.info(
+                f"Extracting a {sample:.1%} sample of submissions for subreddit '{subreddit}' from {self._get_date_range_str()}"
+            )
+            for p in self.periods:
+                sampling.extract_sample(
+                    "RS",
+                    year=p[0],
+                    month=p[1],
+                    subreddit=subreddit,
+                    fraction=sample,
+                    force=force,
+                    index=index,
+                    compress=compress,
+                    workers=workers,
+                    buffer_size=buffer_size,
+                )
+            return
         logging.info(f"Extracting downloaded comments for subreddit '{subreddit}' from {self._get_date_range_str()}")
+        dumpindex.log_expected_sizes("RS", self.periods, subreddit)
         for p in self.periods:
-            extraction.extract_from_dump("RS", year=p[0], month=p[1], subreddit=subreddit, force=force)
+            extraction.extract_from_dump(
+                "RS",
+                year=p[0],
+                month=p[1],
+                subreddit=subreddit,
+                force=force,
+                index=index,
+                compress=compress,
+                workers=workers,
+                download=download,
+                keep=keep,
+                buffer_size=buffer_size,
+            )
 
-    def split(self, since: Union[str, int], until: Union[str, int, None], subreddit: str) -> None:
+    def enqueue(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        force: bool = False,
+        index: bool = True,
+        compress: bool = False,
+        workers: int = 1,
+        download: bool = False,
+        keep: bool = True,
+        retry_failed: bool = False,
+        buffer_size: int = 2 ** 23,
+    ) -> None:
+        import workqueue
+        self._initialize_dates(since, until)
+        subreddit = subreddit.lower().strip()
+        logging.info(f"Queuing submission extraction tasks for subreddit '{subreddit}' from {self._get_date_range_str()}")
+        options = {
+            "force": force,
+            "index": index,
+            "compress": compress,
+            "workers": workers,
+            "download": download,
+            "keep": keep,
+            "buffer_size": buffer_size,
+        }
+        workqueue.enqueue("RS", self.periods, subreddit, options, retry_failed)
+
+    def dumpindex(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None] = None,
+        authors: bool = False,
+        force: bool = False,
+        workers: int = 1,
+    ) -> None:
+        import dumpindex
+        self._initialize_dates(since, until)
+        logging.info(f"Indexing the subreddits of downloaded submission dumps from {self._get_date_range_str()}")
+        for p in self.periods:
+            dumpindex.index_dump("RS", year=p[0], month=p[1], authors=authors, force=force, workers=workers)
+
+    def stats(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        sample: float = 0.01,
+        workers: int = 1,
+    ) -> None:
+        import sampling
+        self._initialize_dates(since, until)
+        subreddit = subreddit.lower().strip()
+        logging.info(
+            f"Estimating the number of '{subreddit}' submissions from {self._get_date_range_str()} "
+            f"from a {sample:.1%} sample"
+        )
+        sampling.estimate_counts("RS", self.periods, subreddit, sample, workers)
+
+    def split(
+        self,
+        since: Union[str, int],
+        until: Union[str, int, None],
+        subreddit: str,
+        use_mmap: bool = False,
+        index: bool = True,
+        compress: bool = False,
+        buffer_size: int = 2 ** 23,
+    ) -> None:
+        import processing
         self._initialize_dates(since, until)
         subreddit = subreddit.lower().strip()
         logging.info(
             f"Splitting monthly '{subreddit}' submission files from {self._get_date_range_str()} into daily files"
         )
         for p in self.periods:
-            processing.split_extracted("RS", year=p[0], month=p[1], subreddit=subreddit)
+            processing.split_extracted(
+                "RS",
+                year=p[0],
+                month=p[1],
+                subreddit=subreddit,
+                use_mmap=use_mmap,
+                index=index,
+                compress=compress,
+                buffer_size=buffer_size,
+            )
+
+    def dictionary(
+        self, since: Union[str, int], until: Union[str, int, None] = None, n_samples: int = 100000
+    ) -> None:
+        import compression
+        self._initialize_dates(since, until)
+        logging.info(f"Training submission compression dictionary on dumps from {self._get_date_range_str()}")
+        compression.train_dictionary_from_dumps("RS", self.periods, n_samples)
 
     def checksize(self, size_ratio=0.8) -> None:
+        import verification
         verification.check_filesizes("RS", size_ratio)
 
     def checkhash(self) -> None:
+        import verification
         verification.check_filehashes("RS")
 
     def list(self, downloaded: bool = True, extracted: bool = False) -> None:
+        import verification
         verification.list_files("RS", downloaded, extracted)
@@ -0,0 +1,166 @@
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import os
+import pathlib
+import shutil
+from typing import Iterator, List, Optional, Tuple, Union
+from config import get_data_dir
+from records import iter_records
+from writing import JsonArrayWriter
+
+
+RUN_SIZE = 200000  # records held in memory per sorted run
+FAN_IN = 128  # maximum number of runs merged at once
+
+
+def _comment_key(d: dict) -> str:
+    return f"{d['link_id']} {int(float(d['created_utc'])):012d} {d['id']}"
+
+
+def _submission_key(d: dict) -> str:
+    return f"t3_{d['id']}"
+
+
+def _write_run(items: List[Tuple[str, str]], fp: pathlib.Path) -> pathlib.Path:
+    items.sort()
+    with open(fp, mode="w", encoding="utf-8", buffering=2 ** 20) as h_out:
+        for key, ln in items:
+            h_out.write(f"{key}\t{ln}\n")
+    return fp
+
+
+def _iter_run(fp: pathlib.Path) -> Iterator[Tuple[str, str]]:
+    with open(fp, mode="r", encoding="utf-8", buffering=2 ** 20) as h_in:
+        for ln in h_in:
+            key, _, data = ln.rstrip("\n").partition("\t")
+            yield key, data
+
+
+def _external_sort(
+    records: Iterator[dict], key_func, tmp_dn: pathlib.Path, name: str, run_size: int
+) -> List[pathlib.Path]:
+    """Write the records as sorted runs of at most run_size records each and merge these runs down to at most
+    FAN_IN runs, so that they can be merged lazily afterwards without holding more than one run in memory"""
+    runs, items = [], []
+    for d in records:
+        items.append((key_func(d), json.dumps(d)))
+        if len(items) >= run_size:
+            runs.append(_write_run(items, tmp_dn / f"{name}_{len(runs)}.run"))
+            items = []
+    if len(items) > 0:
+        runs.append(_write_run(items, tmp_dn / f"{name}_{len(runs)}.run"))
+    n_pass = 0
+    while len(runs) > FAN_IN:
+        n_pass += 1
+        merged = []
+        for i in range(0, len(runs), FAN_IN):
+            group = runs[i : i + FAN_IN]
+            fp = tmp_dn / f"{name}_p{n_pass}_{len(merged)}.run"
+            with open(fp, mode="w", encoding="utf-8", buffering=2 ** 20) as h_out:
+                for key, data in heapq.merge(*[_iter_run(run_fp) for run_fp in group]):
+                    h_out.write(f"{key}\t{data}\n")
+            for run_fp in group:
+                run_fp.unlink()
+            merged.append(fp)
+        runs = merged
+    logging.info(f"Sorted {name} into {len(runs)} run(s)")
+    return runs
+
+
+def _merge_runs(runs: List[pathlib.Path]) -> Iterator[Tuple[str, str]]:
+    return heapq.merge(*[_iter_run(fp) for fp in runs])
+
+
+def _build_tree(comments: List[dict]) -> List[dict]:
+    """Nest the (time-ordered) comments of a thread under their parents in a 'replies' list,
+    comments whose parent is missing are treated as top-level comments"""
+    by_name = {f"t1_{d['id']}": d for d in comments}
+    top = []
+    for d in comments:
+        d["replies"] = []
+    for d in comments:
+        parent = by_name.get(d.get("parent_id"))
+        if parent is None or parent is d:
+            top.append(d)
+        else:
+            parent["replies"].append(d)
+    return top
+
+
+def _iter_threads(comment_runs: List[pathlib.Path], submission_runs: List[pathlib.Path]) -> Iterator[dict]:
+    """Merge-join the sorted comments (grouped by link_id) with the sorted submissions"""
+    submissions = _merge_runs(submission_runs)
+    sub = next(submissions, None)
+    groups = itertools.groupby(_merge_runs(comment_runs), key=lambda item: item[0].split(" ", 1)[0])
+    for link_id, group in groups:
+        while sub is not None and sub[0] < link_id:  # submissions without any comments
+            yield {"link_id": sub[0], "submission": json.loads(sub[1]), "comments": []}
+            sub = next(submissions, None)
+        submission = None
+        if sub is not None and sub[0] == link_id:
+            submission = json.loads(sub[1])
+            sub = next(submissions, None)
+        comments = [json.loads(data) for _, data in group]
+        yield {"link_id": link_id, "submission": submission, "comments": _build_tree(comments)}
+    while sub is not None:
+        yield {"link_id": sub[0], "submission": json.loads(sub[1]), "comments": []}
+        sub = next(submissions, None)
+
+
+def _dump_thread(thread: dict) -> bytes:
+    try:
+        return json.dumps(thread).encode("utf-8")
+    except RecursionError:  # extremely deep chains (e.g. counting threads), fall back to a flat list of comments
+        logging.warning(f"Thread {thread['link_id']} is nested too deeply, writing its comments as a flat list")
+        flat, stack = [], list(reversed(thread["comments"]))
+        while len(stack) > 0:
+            d = stack.pop()
+            stack.extend(reversed(d.pop("replies")))
+            flat.append(d)
+        thread["comments"] = flat
+        return json.dumps(thread).encode("utf-8")
+
+
+def reconstruct_threads(
+    subreddit: str,
+    since: Union[str, int],
+    until: Union[str, int, None],
+    date_range_str: str,
+    run_size: int = RUN_SIZE,
+    index: bool = True,
+    compress: bool = False,
+) -> Optional[pathlib.Path]:
+    """Reconstruct the comment trees of all threads of a subreddit from the extracted comment (and submission)
+    files using a bounded-memory external sort by link_id, writing one record per thread"""
+    subreddit = subreddit.lower()
+    out_dn = get_data_dir() / f"extracted/threads/{subreddit}"
+    out_dn.mkdir(parents=True, exist_ok=True)
+    ext = "json.zst" if compress is True else "json"
+    out_fp = out_dn / f"RC_{subreddit}_{date_range_str}_threads.{ext}"
+    tmp_dn = get_data_dir() / "tmp" / f"threads_{subreddit}_{os.getpid()}"
+    tmp_dn.mkdir(parents=True, exist_ok=True)
+    start = datetime.datetime.utcnow()
+    try:
+        comments = iter_records("RC", since, until, subreddit=subreddit, source="extracted")
+        comment_runs = _external_sort(comments, _comment_key, tmp_dn, "comments", run_size)
+        submissions = iter_records("RS", since, until, subreddit=subreddit, source="extracted")
+        submission_runs = _external_sort(submissions, _submission_key, tmp_dn, "submissions", run_size)
+        with JsonArrayWriter(out_fp, index, compress) as writer:
+            for thread in _iter_threads(comment_runs, submission_runs):
+                if thread["submission"] is not None:
+                    created_utc = thread["submission"]["created_utc"]
+                else:
+                    created_utc = thread["comments"][0]["created_utc"]
+                writer.write(_dump_thread(thread), int(float(created_utc)), thread["link_id"][3:])
+    finally:
+        shutil.rmtree(tmp_dn, ignore_errors=True)
+    duration = str(datetime.datetime.utcnow() - start).split(".")[0].zfill(8)
+    if writer.n == 0:
+        out_fp.unlink()
+        logging.warning(f"No extracted comments or submissions found for '{subreddit}' from {date_range_str}")
+        return None
+    logging.info(f"Saved {writer.n:,} threads to {out_fp.name} after {duration}")
+    return out_fp
@@ -1,10 +1,9 @@
 import hashlib
 import pathlib
-import downloading
 import logging
 import helpers
 from typing import Optional
-from config import DATA_DIR
+from config import get_data_dir
 
 
 def _parse_checksum_file(fp: pathlib.Path) -> dict:
@@ -42,6 +41,8 @@ def check_filesize(fp: pathlib.Path, size_ratio: float = 0.8):
             url = f"https://files.pushshift.io/reddit/submissions/{fp.name}"
         else:
             raise ValueError("File {fp.name} has an invalid prefix")
+        import downloading  # imported on demand, as it pulls in urllib3
+
         try:
             dl_file_size = downloading._check_url_content_length(url)
         except TypeError:  # e.g. when url does not exist and function returns None
@@ -68,6 +69,8 @@ def check_filesize(fp: pathlib.Path, size_ratio: float = 0.8):
 
 def check_filehash(fp: pathlib.Path, check_map: Optional[dict] = None) -> None:
     if check_map is None:
+        import downloading
+
         if fp.name.startswith("RC_"):
             prefix = "RC"
             check_fp = downloading.download_checksum_file("comments")
@@ -102,15 +105,27 @@ def check_filehash(fp: pathlib.Path, check_map: Optional[dict] = None) -> None:
             logging.warning(f"Deleted file with invalid checksum: {fp}")
 
 
+def _get_dump_files(prefix: str) -> list:
+    """Downloaded dumps only, leaving out sidecar files (e.g. dump indexes) and partial downloads"""
+    data_dir = get_data_dir() / "compressed"
+    return [fp for fp in sorted(data_dir.glob(f"{prefix}_*-*.*")) if fp.suffix in (".bz2", ".xz", ".zst")]
+
+
+def _get_extracted_files() -> list:
+    """Extracted (and split) files only, leaving out their record index sidecars and temporary files"""
+    data_dir = get_data_dir() / "extracted"
+    return [fp for fp in sorted(data_dir.glob("**/*_*-*")) if fp.suffix in (".json", ".zst")]
+
+
 def check_filesizes(prefix: str, size_ratio: float = 0.8) -> None:
-    data_dir = DATA_DIR / "compressed"
-    for i, fp in enumerate(sorted(data_dir.glob(f"{prefix}_*-*.*"))):
+    for i, fp in enumerate(_get_dump_files(prefix)):
         logging.info(f"{i} {fp} ({helpers.get_file_size_info_str(fp)})")
         check_filesize(fp, size_ratio)
 
 
 def check_filehashes(prefix: str) -> None:
-    data_dir = DATA_DIR / "compressed"
+    import downloading
+
     logging.info("Downloading the most recent checksum file")
     if prefix == "RC":
         check_fp = downloading.download_checksum_file("comments")
@@ -121,18 +136,16 @@ def check_filehashes(prefix: str) -> None:
 
     check_map = _parse_checksum_file(check_fp)
 
-    for fp in sorted(data_dir.glob(f"{prefix}_*-*.*")):
+    for fp in _get_dump_files(prefix):
         check_filehash(fp, check_map)
 
 
 def list_files(prefix: str, downloaded: bool = True, extracted: bool = False) -> None:
     if downloaded is True:
-        data_dir = DATA_DIR / "compressed"
         logging.info("Downloaded comment dumps:")
-        for i, fp in enumerate(sorted(data_dir.glob(f"{prefix}_*-*.*"))):
+        for i, fp in enumerate(_get_dump_files(prefix)):
             logging.info(f"{i} {fp} ({helpers.get_file_size_info_str(fp)})")
     if extracted is True:
-        data_dir = DATA_DIR / "extracted"
         logging.info("Extracted comment dumps:")
-        for i, fp in enumerate(sorted(data_dir.glob("**/*_*-*"))):
+        for i, fp in enumerate(_get_extracted_files()):
             logging.info(f"{i} {fp} ({helpers.get_file_size_info_str(fp)})")
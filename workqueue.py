@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import pathlib
+import socket
+import threading
+import time
+import traceback
+from typing import List, Optional
+from config import get_data_dir
+
+
+LEASE_TIMEOUT = 600  # seconds without heartbeat after which a lease is considered stale
+HEARTBEAT = 60  # seconds between lease heartbeats
+MAX_ATTEMPTS = 3
+
+
+def get_queue_dir(state: str) -> pathlib.Path:
+    """Folder of the shared queue for tasks, leases, done or failed (the data folder may be shared by many hosts)"""
+    dn = get_data_dir() / "queue" / state
+    dn.mkdir(parents=True, exist_ok=True)
+    return dn
+
+
+def get_task_name(prefix: str, year: int, month: int, subreddit: str) -> str:
+    return f"{prefix}_{subreddit}_{year}-{str(month).zfill(2)}.json"
+
+
+def _get_worker_id() -> str:
+    return f"{socket.gethostname()}.{os.getpid()}"
+
+
+def _write_atomically(fp: pathlib.Path, d: dict) -> None:
+    tmp_fp = fp.with_name(f"{fp.name}.{_get_worker_id()}.tmp")
+    tmp_fp.write_text(json.dumps(d))
+    os.replace(tmp_fp, fp)
+
+
+def enqueue(prefix: str, periods: List[tuple], subreddit: str, options: dict, retry_failed: bool = False) -> int:
+    """Add one extraction task per period to the queue, unless it's queued or done already. Failed tasks
+    are only queued again (with a reset attempt counter) if retry_failed is True"""
+    n = 0
+    for year, month in periods:
+        name = get_task_name(prefix, year, month, subreddit)
+        task_fp = get_queue_dir("tasks") / name
+        if task_fp.is_file() or (get_queue_dir("done") / name).is_file():
+            continue
+        failed_fp = get_queue_dir("failed") / name
+        if failed_fp.is_file():
+            if retry_failed is False:
+                logging.info(f"Skipping failed task {name} (--retry_failed=True to queue it again)")
+                continue
+            failed_fp.unlink()
+        task = {"prefix": prefix, "year": year, "month": month, "subreddit": subreddit, "attempts": 0}
+        task["options"] = options
+        _write_atomically(task_fp, task)
+        n += 1
+    logging.info(f"Queued {n} task(s) in {get_queue_dir('tasks')}")
+    return n
+
+
+class Lease:
+    """Exclusive claim of a task by one worker, held by a lease file that is created atomically (O_EXCL)
+    and kept alive by a heartbeat thread that touches it. Leases whose heartbeat stopped for longer than
+    timeout (e.g. because the worker's host died) can be taken over by other workers"""
+
+    def __init__(self, name: str, timeout: float = LEASE_TIMEOUT, heartbeat: float = HEARTBEAT) -> None:
+        self.fp = get_queue_dir("leases") / name
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.token = f"{_get_worker_id()}.{time.time()}"
+        self.is_taken_over = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _create(self) -> bool:
+        try:
+            fd = os.open(self.fp, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as h_out:
+            h_out.write(self.token)
+        return True
+
+    def _read_token(self, fp: pathlib.Path) -> Optional[str]:
+        try:
+            return fp.read_text()
+        except FileNotFoundError:
+            return None
+
+    def _take_over_stale(self) -> bool:
+        """Move a stale lease out of the way with a rename (which only one worker can do successfully) and
+        make sure that what was moved is still the stale lease and not a fresh one of a faster worker"""
+        try:
+            age = time.time() - self.fp.stat().st_mtime
+        except FileNotFoundError:
+            return self._create()
+        if age < self.timeout:
+            return False
+        stale_token = self._read_token(self.fp)
+        stale_fp = self.fp.with_name(f"{self.fp.name}.{_get_worker_id()}.stale")
+        try:
+            os.rename(self.fp, stale_fp)
+        except FileNotFoundError:
+            return False
+        if self._read_token(stale_fp) != stale_token:  # someone else renewed it in between, put it back
+            try:
+                os.link(stale_fp, self.fp)
+            except FileExistsError:
+                pass
+            stale_fp.unlink()
+            return False
+        stale_fp.unlink()
+        logging.warning(f"Taking over stale lease {self.fp.name} of {stale_token}")
+        self.is_taken_over = True
+        return self._create()
+
+    def acquire(self) -> bool:
+        if self._create() is False and self._take_over_stale() is False:
+            return False
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        self._thread.start()
+        return True
+
+    def is_held(self) -> bool:
+        return self._read_token(self.fp) == self.token
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.heartbeat):
+            if self.is_held() is False:
+                logging.warning(f"Lost lease {self.fp.name}, another worker may be processing the same task")
+                return
+            os.utime(self.fp)
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.is_held() is True:
+            self.fp.unlink()
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def _run_task(task: dict) -> None:
+    import extraction
+
+    is_available = extraction.extract_from_dump(
+        task["prefix"],
+        year=task["year"],
+        month=task["month"],
+        subreddit=task["subreddit"],
+        **task["options"],
+    )
+    if is_available is False:  # may be downloaded later, so this must not end up as done
+        raise FileNotFoundError(f"The {task['prefix']} dump for {task['year']}-{task['month']:02d} is not available")
+
+
+def _finish_task(task_fp: pathlib.Path, task: dict, error: Optional[str], max_attempts: int) -> None:
+    if error is None:
+        os.replace(task_fp, get_queue_dir("done") / task_fp.name)
+        return
+    task["attempts"] += 1
+    task["error"] = error
+    if task["attempts"] >= max_attempts:
+        logging.error(f"Task {task_fp.name} failed {task['attempts']} time(s), giving up on it")
+        _write_atomically(get_queue_dir("failed") / task_fp.name, task)
+        task_fp.unlink()
+    else:
+        logging.warning(f"Task {task_fp.name} failed (attempt {task['attempts']} of {max_attempts}), requeuing it")
+        _write_atomically(task_fp, task)
+
+
+def _claim_next_task(lease_timeout: float, heartbeat: float) -> Optional[Lease]:
+    for task_fp in sorted(get_queue_dir("tasks").glob("*.json")):
+        lease = Lease(task_fp.name, lease_timeout, heartbeat)
+        if lease.acquire() is True:
+            if task_fp.is_file():  # it may have been finished between listing and claiming
+                return lease
+            lease.release()
+    return None
+
+
+def work(
+    max_tasks: Optional[int] = None,
+    lease_timeout: float = LEASE_TIMEOUT,
+    heartbeat: float = HEARTBEAT,
+    max_attempts: int = MAX_ATTEMPTS,
+    wait: bool = False,
+) -> int:
+    """Claim and run queued tasks until the queue is empty (or until all remaining tasks are finished by
+    other workers if wait is True), returns the number of tasks run by this worker"""
+    n = 0
+    while max_tasks is None or n < max_tasks:
+        lease = _claim_next_task(lease_timeout, heartbeat)
+        if lease is None:
+            if wait is True and any(get_queue_dir("tasks").glob("*.json")):
+                time.sleep(heartbeat)  # tasks leased by other workers may still fail or go stale
+                continue
+            break
+        with lease:
+            task_fp = get_queue_dir("tasks") / lease.fp.name
+            try:
+                task = json.loads(task_fp.read_text())
+            except FileNotFoundError:  # finished by another worker between claiming and reading it
+                continue
+            if lease.is_taken_over is True:  # the previous worker died while running it
+                if task["attempts"] + 1 >= max_attempts:
+                    _finish_task(task_fp, task, "Lease expired", max_attempts)
+                    continue
+                task["attempts"] += 1
+                task["error"] = "Lease expired"
+                _write_atomically(task_fp, task)  # persist right away, in case this run dies the same way
+            logging.info(f"Running task {task_fp.name} as {_get_worker_id()}")
+            error = None
+            try:
+                _run_task(task)
+            except Exception:
+                error = traceback.format_exc()
+                logging.error(error)
+            if lease.is_held() is False:  # taken over as stale, so the task belongs to another worker now
+                logging.warning(f"Lost lease {lease.fp.name} while running it, dropping the result")
+                continue
+            _finish_task(task_fp, task, error, max_attempts)
+            n += 1
+    logging.info(f"Worker {_get_worker_id()} finished after running {n} task(s)")
+    return n
+
+
+class QueueTool:
+    def work(
+        self,
+        max_tasks: Optional[int] = None,
+        lease_timeout: float = LEASE_TIMEOUT,
+        heartbeat: float = HEARTBEAT,
+        max_attempts: int = MAX_ATTEMPTS,
+        wait: bool = False,
+    ) -> None:
+        work(max_tasks, lease_timeout, heartbeat, max_attempts, wait)
+
+    def status(self) -> None:
+        for state in ("tasks", "leases", "done", "failed"):
+            names = sorted(fp.name for fp in get_queue_dir(state).glob("*.json"))
+            logging.info(f"{state}: {len(names)}")
+            if state in ("leases", "failed"):
+                for name in names:
+                    logging.info(f"  {name}")
@@ -0,0 +1,85 @@
+import logging
+import pathlib
+import time
+from indexing import RecordIndex, get_index_path
+
+
+BUFFER_SIZE = 2 ** 23  # 8MB
+LOG_INTERVAL = 30  # seconds between progress messages
+
+
+class JsonArrayWriter:
+    """Write records (one JSON object per line) as a JSON array and optionally record
+    each object's position in a sidecar RecordIndex. If compress is True, the output is written as zstd
+    using the trained dictionary for the file's prefix and the index refers to the decompressed positions.
+    Records are collected in batches of up to buffer_size bytes that are written at once, so that writing
+    costs no more than a list append per record"""
+
+    def __init__(
+        self, fp: pathlib.Path, index: bool = True, compress: bool = False, buffer_size: int = BUFFER_SIZE
+    ) -> None:
+        self.fp = fp
+        self.n = 0
+        self.pos = 0
+        self.index = RecordIndex() if index is True else None
+        self.buffer_size = buffer_size
+        self.batch = []
+        self.batch_size = 0
+        self.last_log = time.monotonic()
+        if compress is True:
+            import compression
+
+            self.h_out = compression.open_compressed_writer(fp, compression.get_prefix_for_path(fp))
+        else:
+            self.h_out = open(fp, mode="wb", buffering=buffer_size)
+
+    def write(self, ln: bytes, created_utc: int, item_id: str) -> None:
+        self.batch.append(b",\n" if self.n > 0 else b"[\n")  # initial [ for array of json obj, comma otherwise
+        self.batch.append(ln)
+        length = len(ln)
+        if self.index is not None:
+            self.index.append(self.pos + 2, length, int(created_utc), item_id)
+        self.pos += length + 2
+        self.batch_size += length + 2
+        self.n += 1
+        if self.batch_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.batch) > 0:
+            self.h_out.write(b"".join(self.batch))
+            self.batch.clear()  # also releases any memoryviews (e.g. of mmapped input) held by the batch
+            self.batch_size = 0
+        now = time.monotonic()
+        if now - self.last_log >= LOG_INTERVAL:
+            logging.info(f"{self.n:,} lines written to {self.fp.name} so far")
+            self.last_log = now
+
+    def close(self) -> int:
+        if self.n > 0:  # write final ]
+            self.batch.append(b"\n]")
+        self.flush()
+        self.h_out.close()
+        if self.index is not None and self.n > 0:
+            self.index.save(get_index_path(self.fp))
+        elif self.index is None:  # an index of a previous version of the file would point into the wrong bytes
+            try:
+                get_index_path(self.fp).unlink()
+            except FileNotFoundError:
+                pass
+        return self.n
+
+    def discard(self) -> None:
+        """Drop the batch and remove the partly written file (and no index is written), e.g. after an error"""
+        self.batch.clear()
+        self.h_out.close()
+        try:
+            self.fp.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "JsonArrayWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()